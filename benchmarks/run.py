@@ -0,0 +1,216 @@
+'''
+	Benchmarks of the build, load and convert paths of biorosetta.
+
+	Usage:
+		python benchmarks/run.py [--quick] [--output benchmarks/results] [--compare benchmarks/results/<commit>.json]
+
+	The local sources are built from the bundled data/hgnc.tsv and from a synthetic Ensembl Biomart table derived from
+	it (several proteins per gene), and MyGene is replaced by a client answering from the same data. Index build and
+	cache load are measured in fresh processes, to report their peak RSS. Results are written to <output>/<commit>.json
+	and can be compared with the results of another commit with --compare.
+'''
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(root))
+import biorosetta as br
+from biorosetta.classes import LocalSource
+
+
+class FakeMyGeneClient:
+	'''
+		Replaces the MyGene client, answering queries from a local table after a fixed latency per request.
+	'''
+	fields = {'entrezgene': 'entr', 'symbol': 'symb', 'ensembl.gene': 'ensg'}
+
+	def __init__(self, data, latency=0.0):
+		self._data = data
+		self._latency = latency
+		self._tables = {}
+
+	def getgenes(self, ids, scopes, fields, species, as_dataframe, returnall):
+		if (scopes, fields) not in self._tables:
+			pairs = self._data[[self.fields[scopes], self.fields[fields]]].dropna().drop_duplicates(self.fields[scopes])
+			self._tables[(scopes, fields)] = pairs.set_index(self.fields[scopes])[self.fields[fields]]
+		time.sleep(self._latency)
+		return pd.DataFrame({fields: self._tables[(scopes, fields)].reindex(ids).values}, index=pd.Index(ids, name='query'))
+
+
+def make_ensembl(hgnc, path, seed=0):
+	rng = np.random.default_rng(seed)
+	genes = hgnc[['ensg', 'entr', 'hgnc', 'symb', 'synonym1']].rename(columns={'synonym1': 'synonym'})
+	n_prot = rng.integers(0, 4, len(genes))
+	data = genes.loc[genes.index.repeat(np.maximum(n_prot, 1))].reset_index(drop=True)
+	data['ensp'] = ['ENSP%011d' % i if n > 0 else None for i, n in enumerate(np.repeat(n_prot, np.maximum(n_prot, 1)))]
+	data[['ensg', 'ensp', 'entr', 'hgnc', 'symb', 'synonym']].to_csv(path, sep='\t', index=False)
+
+
+def make_fixtures(folder):
+	shutil.copy(root / 'data' / 'hgnc.tsv', folder / 'hgnc.tsv')
+	make_ensembl(pd.read_table(folder / 'hgnc.tsv', dtype=str), folder / 'ensembl.tsv')
+
+
+def load_source(name, folder):
+	if name == 'ensembl':
+		return br.EnsemblBiomartMapper(data_path=str(folder / 'ensembl.tsv'))
+	return br.HGNCBiomartMapper(data_path=str(folder / 'hgnc.tsv'))
+
+
+def child(stage, name, folder):
+	'''
+		Runs in a fresh process: builds or loads a source and returns the elapsed time and peak RSS.
+	'''
+	if stage == 'build':
+		Path(folder / f'{name}.idx').unlink(missing_ok=True)
+	rss_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	start = time.perf_counter()
+	src = load_source(name, folder)
+	if stage == 'build':
+		src.warm()
+	seconds = time.perf_counter() - start
+	rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return {'seconds': seconds, 'max_rss_mb': rss / 1024, 'delta_rss_mb': (rss - rss_start) / 1024}
+
+
+def run_child(stage, name, folder):
+	out = subprocess.run([sys.executable, __file__, '--child', stage, name, str(folder)], capture_output=True, text=True, check=True)
+	return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def timeit(func, repeat):
+	times = []
+	for _ in range(repeat):
+		start = time.perf_counter()
+		func()
+		times.append(time.perf_counter() - start)
+	return min(times)
+
+
+def sample_ids(pool, size, dup_rate, rng):
+	n_distinct = max(1, int(size * (1 - dup_rate)))
+	distinct = rng.choice(pool, n_distinct, replace=n_distinct > len(pool))
+	return list(np.concatenate([distinct, rng.choice(distinct, size - n_distinct)]))
+
+
+def bench_convert(folder, quick, rng):
+	hgnc_data = pd.read_table(folder / 'hgnc.tsv', dtype=str)
+	mappers = {'hgnc': load_source('hgnc', folder), 'ensembl': load_source('ensembl', folder)}
+	mappers['mygene'] = br.MyGeneMapper(client=FakeMyGeneClient(hgnc_data, latency=0.01))
+	combos = [['hgnc'], ['ensembl'], ['ensembl', 'hgnc'], ['ensembl', 'hgnc', 'mygene']]
+	sizes = [1000, 10000] if quick else [1000, 10000, 100000, 1000000]
+	dup_rates = [0.0, 0.9] if quick else [0.0, 0.5, 0.9]
+	pairs = [('symb', 'ensg'), ('ensg', 'entr')]
+	repeat = 1 if quick else 3
+	results = []
+	for id_in, id_out in pairs:
+		pool = hgnc_data[id_in].dropna().unique()
+		for size in sizes:
+			for dup_rate in dup_rates:
+				ids = sample_ids(pool, size, dup_rate, rng)
+				for combo in combos:
+					if 'mygene' in combo and size > 10000:
+						continue
+					idm = br.IDMapper([mappers[src_id] for src_id in combo], fill_value='N/A')
+					modes = ['first', 'all', 'shortest'] + (['consensus'] if len(combo) > 1 else [])
+					for multi_hits in modes:
+						idm.convert(ids[:100], id_in, id_out, multi_hits=multi_hits) # builds the lookup tables
+						seconds = timeit(lambda: idm.convert(ids, id_in, id_out, multi_hits=multi_hits), repeat)
+						results.append({'name': f'convert/{"+".join(combo)}/{id_in}2{id_out}/{multi_hits}/n={size}/dup={dup_rate}',
+										'seconds': seconds, 'ids_per_second': size / seconds})
+	return results
+
+
+def bench_synonyms(folder, repeat):
+	data = pd.read_table(folder / 'ensembl.tsv', sep='\t', dtype={'entr': 'str'})
+
+	def build():
+		src = LocalSource('ensembl', data[['ensg', 'ensp', 'entr', 'hgnc', 'symb']])
+		src.integrate_synonyms(data[['symb', 'synonym']], 'symb', 'synonym')
+		src.warm()
+
+	return [{'name': 'build/ensembl/in-memory+synonyms', 'seconds': timeit(build, repeat)}]
+
+
+def git_commit():
+	try:
+		return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=root, capture_output=True, text=True, check=True).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		return 'unknown'
+
+
+def compare(results, baseline_path):
+	baseline = {res['name']: res for res in json.loads(Path(baseline_path).read_text())['results']}
+	print(f'{"benchmark":<70} {"base (s)":>10} {"new (s)":>10} {"ratio":>7}')
+	for res in results:
+		if res['name'] in baseline:
+			base = baseline[res['name']]['seconds']
+			print(f'{res["name"]:<70} {base:>10.4f} {res["seconds"]:>10.4f} {res["seconds"] / base:>7.2f}')
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Benchmarks of biorosetta')
+	parser.add_argument('--quick', action='store_true', help='Run a reduced set of input sizes and repetitions')
+	parser.add_argument('--output', default=str(root / 'benchmarks' / 'results'), help='Folder of the results')
+	parser.add_argument('--compare', help='Results of a previous run to compare with')
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--child', nargs=3, help=argparse.SUPPRESS)
+	args = parser.parse_args()
+	if args.child is not None:
+		with open(os.devnull, 'w') as devnull:
+			stdout, sys.stdout = sys.stdout, devnull
+			try:
+				stage, name, folder = args.child
+				result = child(stage, name, Path(folder))
+			finally:
+				sys.stdout = stdout
+		print(json.dumps(result))
+		return
+
+	folder = Path(tempfile.mkdtemp(prefix='biorosetta_bench_'))
+	try:
+		make_fixtures(folder)
+		results = []
+		for name in ['hgnc', 'ensembl']:
+			for stage in ['build', 'load']:
+				res = run_child(stage, name, folder)
+				results.append({'name': f'{stage}/{name}', **res})
+				print(f'{stage}/{name}: {res["seconds"]:.3f}s, peak RSS {res["max_rss_mb"]:.0f}MB')
+		results += bench_synonyms(folder, 1 if args.quick else 3)
+		with open(os.devnull, 'w') as devnull:
+			stdout, sys.stdout = sys.stdout, devnull # silences the messages of the mappers
+			try:
+				results += bench_convert(folder, args.quick, np.random.default_rng(args.seed))
+			finally:
+				sys.stdout = stdout
+	finally:
+		shutil.rmtree(folder, ignore_errors=True)
+
+	for res in results:
+		if 'ids_per_second' in res:
+			print(f'{res["name"]}: {res["ids_per_second"]:,.0f} IDs/s')
+	commit = git_commit()
+	output = Path(args.output)
+	output.mkdir(parents=True, exist_ok=True)
+	report = {'commit': commit, 'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 'quick': args.quick,
+			  'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__, 'results': results}
+	(output / f'{commit}.json').write_text(json.dumps(report, indent=1))
+	print(f'Results written to {output / f"{commit}.json"}')
+	if args.compare is not None:
+		compare(results, args.compare)
+
+
+if __name__ == '__main__':
+	main()
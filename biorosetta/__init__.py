@@ -1,4 +1,8 @@
-from .classes import IDMapper, HGNCBiomartMapper, EnsemblBiomartMapper, MyGeneMapper
+from .classes import IDMapper, HGNCBiomartMapper, EnsemblBiomartMapper, EnsemblOrthologMapper, MyGeneMapper
+from .server import MapperServer, MapperClient
+from .instrument import Instrumentation, instrumentation
+from .resolve import SymbolResolver
+from .species import SpeciesMapper
 
 id_type_labels = {'ensg':'Ensembl gene ID',
           'entr':'NCBI gene ID (entrezgene)',
@@ -0,0 +1,112 @@
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+
+class ResultCache:
+	'''
+		Persistent cache of remote source results, stored in a SQLite database. Entries are keyed on
+		(ID, scope, field, species), expire after a time-to-live and the least recently used ones are evicted
+		when the cache exceeds its maximum size. IDs not found by the remote source are cached as well.
+		SQLite connections cannot be used across fork(), so each process opens its own connection on first use.
+	'''
+	def __init__(self, path, ttl=7 * 24 * 3600, max_size=1000000, negative_ttl=None):
+		'''
+			:param str path: Path of the SQLite database
+			:param float ttl: Time-to-live of the entries, in seconds (None for no expiration)
+			:param int max_size: Maximum number of entries
+			:param float negative_ttl: Time-to-live of the entries for IDs not found (default: same as ttl)
+			:return: ResultCache object
+			:rtype: ResultCache
+		'''
+		Path(path).parent.mkdir(parents=True, exist_ok=True)
+		self.path = str(path)
+		self.ttl = ttl
+		self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+		self.max_size = max_size
+		self.stats = {'hits': 0, 'negative_hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0}
+		self._pid = None
+		self._inherited = [] # connections of parent processes, never used nor closed by this process
+		with self._connection() as conn:
+			conn.execute('PRAGMA journal_mode=WAL')
+			conn.execute('CREATE TABLE IF NOT EXISTS results (id TEXT, scope TEXT, field TEXT, species TEXT, value TEXT, '
+						 'created REAL, accessed REAL, PRIMARY KEY (id, scope, field, species))')
+			conn.execute('CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)')
+
+	def _connection(self):
+		'''
+			:return: SQLite connection of the current process, opened on first use
+			:rtype: Connection
+		'''
+		if self._pid != os.getpid():
+			if self._pid is not None:
+				self._inherited.append(self._conn)
+			self._lock = threading.Lock()
+			self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+			self._pid = os.getpid()
+		return self._conn
+
+	def __getstate__(self):
+		state = {key: value for key, value in self.__dict__.items() if key not in ['_conn', '_lock', '_inherited']}
+		return dict(state, _pid=None, _inherited=[])
+
+	def get(self, id_list, scope, field, species):
+		'''
+			:param list id_list: IDs to look up
+			:param str scope: Input field queried
+			:param str field: Output field
+			:param str species: Species
+			:return: Dictionary with the cached IDs, mapped to their value (None for IDs cached as not found)
+			:rtype: dict
+		'''
+		now = time.time()
+		found = {}
+		conn = self._connection()
+		with self._lock, conn:
+			for i in range(0, len(id_list), 500):
+				chunk = id_list[i:i + 500]
+				rows = conn.execute(f'SELECT id, value, created FROM results WHERE scope=? AND field=? AND species=? '
+									f'AND id IN ({",".join("?" * len(chunk))})', [scope, field, species] + list(chunk)).fetchall()
+				for id_, value, created in rows:
+					ttl = self.ttl if value is not None else self.negative_ttl
+					if ttl is not None and now - created > ttl:
+						self.stats['expired'] += 1
+						continue
+					found[id_] = value
+			conn.executemany('UPDATE results SET accessed=? WHERE id=? AND scope=? AND field=? AND species=?',
+							 [(now, id_, scope, field, species) for id_ in found])
+		n_negative = sum(value is None for value in found.values())
+		self.stats['hits'] += len(found) - n_negative
+		self.stats['negative_hits'] += n_negative
+		self.stats['misses'] += len(set(id_list)) - len(found)
+		return found
+
+	def set(self, values, scope, field, species):
+		'''
+			:param dict values: Dictionary mapping IDs to their value (None for IDs not found)
+			:param str scope: Input field queried
+			:param str field: Output field
+			:param str species: Species
+		'''
+		now = time.time()
+		conn = self._connection()
+		with self._lock, conn:
+			conn.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)',
+							 [(id_, scope, field, species, value, now, now) for id_, value in values.items()])
+			size = conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+			if size > self.max_size:
+				conn.execute('DELETE FROM results WHERE rowid IN (SELECT rowid FROM results ORDER BY accessed LIMIT ?)',
+							 [size - self.max_size])
+				self.stats['evictions'] += size - self.max_size
+
+	def clear(self):
+		conn = self._connection()
+		with self._lock, conn:
+			conn.execute('DELETE FROM results')
+
+	def __len__(self):
+		conn = self._connection()
+		with self._lock:
+			return conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
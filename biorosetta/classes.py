@@ -1,62 +1,93 @@
 from biothings_client import get_client
 from pathlib import Path
 from .utils import *
+from .index import LookupIndex
+from .cache import ResultCache
+from .planner import MappingPlanner
+from .instrument import instrumentation
+from .resolve import SymbolResolver
 import os
-import pickle
+import time
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 
 lib_folder = os.path.dirname(os.path.realpath(__file__))
 
 
 
 class Source:
+	cost = 1.0 # relative cost of converting IDs, used to plan multi-hop conversions
+	expected_coverage = 1.0
+	instrumentation = instrumentation # shared by default, see IDMapper instrumentation
+
 	def __init__(self, source_id, fill_value='N/A'):
 		self.source_id = source_id
 		self._fill_value = fill_value
 
+	def coverage(self, id_in, id_out):
+		'''
+			:return: Estimated fraction of input IDs that the source can map
+			:rtype: float
+		'''
+		return self.expected_coverage
+
 	def sanitize(self, id_list, id_in, id_out):
 		if not self.has_id_in_type(id_in):
 			raise ValueError(f'{self.source_id}: invalid input ID type')
 		if not self.has_id_out_type(id_out):
 			raise ValueError(f'{self.source_id}: invalid output ID type')
 
-		return list(map(str, make_list(id_list)))
+		id_list = make_list(id_list)
+		if not isinstance(id_list, (list, np.ndarray, pd.Series, pd.Index)):
+			id_list = list(id_list)
+		return as_strings(np.asarray(id_list, dtype=object))
 
 	def filter_multi_hits(self, out_df, multi_hits):
+		multi = out_df.str.contains('|', regex=False)
+		if not multi.any():
+			return out_df
 		if multi_hits == 'first':
-			out_df[out_df.str.contains('\|')] = out_df[out_df.str.contains('\|')].str.split('|').str[0]
-		if multi_hits == 'shortest':
-			out_df[out_df.str.contains('\|')] = out_df[out_df.str.contains('\|')].str.split('|').apply(lambda x: min(x,key=len))
+			out_df[multi] = out_df[multi].str.split('|', n=1).str[0]
+		elif multi_hits == 'shortest':
+			hits = out_df[multi].str.split('|')
+			flat = hits.explode()
+			rows = np.repeat(np.arange(len(hits)), hits.str.len())
+			order = np.lexsort((flat.str.len().values, rows))
+			first = np.r_[True, rows[order][1:] != rows[order][:-1]]
+			out_df[multi] = flat.values[order[first]]
 		elif callable(multi_hits):
-			out_df[out_df.str.contains('\|')] = map(multi_hits, out_df[out_df.str.contains('\|')].str.split('|').tolist())
+			keys, inverse = np.unique(out_df[multi].values.astype(object), return_inverse=True) # apply once per distinct hit list
+			out_df[multi] = np.array([multi_hits(key.split('|')) for key in keys], dtype=object)[inverse]
 		elif multi_hits == 'all': # just here as placeholder, but any other value will do
 			pass
 		return out_df
 
 
 class LocalSource(Source):
+	_cache_path = None
+	_persist_tables = False
+
 	def __init__(self, source_id, data, fill_value='N/A'):
 		super().__init__(source_id, fill_value=fill_value)
 
-		self._data = data
-		self.init()
-
+		self.init(data)
 
-	def init(self):
-		data = self._data
-		self._lookup = {}
 
-		id_types = data.columns.tolist()
-		for id_in in id_types:
-			self._lookup[id_in] = {}
-			for id_out in id_types:
-				if id_in == id_out:
-					continue
+	def init(self, data):
+		self._index = LookupIndex.from_dataframe(data)
 
-				self._lookup[id_in][id_out] = self.gen_lookup_table(data, id_in, id_out,
-																	lambda id_in, id_out_list: '|'.join(
-																		id_out_list))
+	def warm(self, pairs=None, max_workers=None):
+		'''
+			Builds lookup tables in advance instead of on their first use, in parallel threads. If the source
+			persists its tables, the new tables are also written to the cache.
 
+			:param list pairs: List of (id_in, id_out) tuples (default: all pairs)
+			:param int max_workers: Maximum number of threads building tables (default: one per core)
+		'''
+		with self.instrumentation.stage(f'{self.source_id}.build_table'):
+			new_pairs = self._index.build_tables(pairs, max_workers=max_workers)
+		if len(new_pairs) > 0 and self._persist_tables and self._cache_path is not None:
+			self._index.save(self._cache_path)
 
 	def convert(self, id_list, id_in, id_out, multi_hits='first', df=False):
 		'''
@@ -72,132 +103,236 @@ class LocalSource(Source):
 			:rtype: list or DataFrame
 		'''
 		multi_ids = is_list(id_list)
-		id_list = self.sanitize(id_list, id_in, id_out)
-		out_df = self._lookup[id_in][id_out].reindex(id_list, fill_value=self._fill_value)
-		out_df = self.filter_multi_hits(out_df, multi_hits)
-		if self._fill_value == 'passthrough':
-			out_df = pd.Series(np.where(out_df == 'passthrough', out_df.index, out_df.values), index=out_df.index)
+		with self.instrumentation.stage(f'{self.source_id}.sanitize'):
+			id_list = self.sanitize(id_list, id_in, id_out)
+		output = self.convert_array(id_list, id_in, id_out, multi_hits=multi_hits)
 		if df:
-			return out_df
+			return pd.Series(output, index=pd.Index(id_list, name=id_in), name=id_out)
 		else:
-			output = out_df.values
 			if multi_ids:
 				return output.tolist()
 			else:
 				return output.tolist()[0]
 
+	def convert_array(self, ids, id_in, id_out, multi_hits='first'):
+		'''
+			Maps an array of IDs without converting it to a list, for callers that already hold strings.
 
-	def gen_lookup_table(self, data, id_in, id_out, selection_func):
-		pruned = data[data[id_in].notna() & data[id_out].notna()]
-		pruned = pruned[~pruned.duplicated(subset=[id_in, id_out])]
-		id_in_unq = ~pruned.duplicated(subset=[id_in], keep=False)
-		unq = pruned.loc[id_in_unq].set_index(id_in)[id_out]
-
-		if (~id_in_unq).sum() > 0:
-			nonunq = pruned.loc[~id_in_unq, [id_in, id_out]].groupby(id_in).apply(
-				lambda x: selection_func(x.name, x[id_out]))
-			# nonunq = pruned.loc[~id_in_unq, [id_in, id_out]].groupby(id_in).apply(lambda x: print(x))
-			lookup = pd.concat([unq, nonunq])
-		else:
-			lookup = unq
-		return lookup
+			:param ndarray ids: Object array of IDs, as strings
+			:param str id_in: Input ID type
+			:param str id_out: Output ID type
+			:param str multi_hits: Aggregation method for multi hits (see LocalSource.convert())
+			:return: Object array with the mapped IDs (fill value for IDs not found)
+			:rtype: ndarray
+		'''
+		ins = self.instrumentation
+		if not self.has_id_in_type(id_in):
+			raise ValueError(f'{self.source_id}: invalid input ID type')
+		if not self.has_id_out_type(id_out):
+			raise ValueError(f'{self.source_id}: invalid output ID type')
+		if not self._index.has_table(id_in, id_out):
+			self.warm([(id_in, id_out)])
+		with ins.stage(f'{self.source_id}.lookup', len(ids)):
+			output = self._index.lookup(ids, id_in, id_out, multi_hits=multi_hits)
+			missing = pd.isnull(output)
+			if self._fill_value == 'passthrough':
+				output[missing] = ids[missing]
+			else:
+				output[missing] = self._fill_value
+		ins.count(f'{self.source_id}.hits', len(ids) - int(missing.sum()))
+		ins.count(f'{self.source_id}.misses', int(missing.sum()))
+		return output
 
 	def integrate_synonyms(self, data, id_orig, id_synonym):
-		pruned = data[data[id_orig].notna() & data[id_synonym].notna()]
-		pruned = pruned[~pruned.duplicated(subset=[id_orig, id_synonym])]
-		pruned = pruned[~pruned.duplicated(subset=[id_synonym], keep=False)]  # we just remove inconsistent synonyms
-		for id_out in self._lookup[id_orig].keys():
-			lookup = self._lookup[id_orig][id_out]
-			pruned_curr = pruned.loc[~pruned[id_synonym].isin(lookup.index) & pruned[id_orig].isin(lookup.index)].copy()
-			pruned_curr[id_out] = lookup.loc[pruned_curr[id_orig].values].values
-			if pruned_curr.shape[0] > 0:
-				pruned_curr = pruned_curr.set_index(id_synonym)[id_out].squeeze()
-				self._lookup[id_orig][id_out] = pd.concat([lookup, pruned_curr])
+		self._index.add_synonyms(data, id_orig, id_synonym)
+
+	@property
+	def id_types(self):
+		return self._index.id_types
+
+	def coverage(self, id_in, id_out):
+		return self._index.coverage(id_in, id_out)
 
 	def has_id_in_type(self, id_type):
-		return id_type in self._data.columns
+		return id_type in self._index.id_types
 
 	def has_id_out_type(self, id_type):
-		return id_type in self._data.columns
+		return id_type in self._index.id_types
 
 	def lookup_size(self):
-		for id_in, id_in_dict in self._lookup.items():
-			for id_out, id_out_dict in id_in_dict.items():
-				print(id_in, ' ->', id_out, ':', len(id_out_dict))
+		for (id_in, id_out), size in self._index.sizes().items():
+			print(id_in, ' ->', id_out, ':', size)
+
+	@classmethod
+	def refresh(cls, data_path=None, url=None, force=False, **kwargs):
+		'''
+			Downloads the source data again if it changed on the server since the previous download (ETag/Last-Modified),
+			and rebuilds the lookup tables only if the data changed.
+
+			:param str data_path: Path where the local data for this source is stored (default: internal package folder)
+			:param str url: URL of the source data (default: source Biomart query)
+			:param bool force: Whether to download the data even if the server reports no change
+			:param kwargs: Arguments passed to the source constructor
+			:return: Source object and DataFrame of the genes added, retired and renamed (see utils.change_report(), empty if the data did not change)
+			:rtype: tuple
+		'''
+		species = kwargs.get('species', 'human')
+		if data_path is None:
+			data_path = lib_folder + '/data/' + cls.species_file(species)
+		cache_path = str(Path(data_path).with_suffix('.idx'))
+		old = None
+		if Path(cache_path).exists():
+			try:
+				old = LookupIndex.open(cache_path).to_dataframe(['ensg', 'symb'])
+			except ValueError:
+				pass
+		if old is None and Path(data_path).exists():
+			old = pd.read_table(data_path, usecols=['ensg', 'symb'], dtype=str)
+		cls.download_data(data_path, url=url, conditional=not force, species=species)
+		src = cls(data_path=data_path, **kwargs)
+		return src, change_report(old, src._index.to_dataframe(['ensg', 'symb']))
+
+	@classmethod
+	def species_file(cls, species='human'):
+		'''
+			:param str species: Species
+			:return: Name of the data file of the species in the internal package folder
+			:rtype: str
+		'''
+		if species == 'human':
+			return cls.data_file
+		return f'{Path(cls.data_file).stem}_{species}.tsv'
 
-	def build_cache(self, cache_path):
-		with open(cache_path, 'wb') as f:
-			pickle.dump([self._data, self._lookup], f)
+	def nbytes(self):
+		return self._index.nbytes()
 
-	def load_cache(self, cache_path):
-		with open(cache_path, 'rb') as f:
-			data,lookup = pickle.load(f)
-		self._data = data
-		self._lookup = lookup
+	def build_cache(self, cache_path, data_path=None, options=None):
+		'''
+			:param str cache_path: Path of the index file
+			:param str data_path: Source data file the index was built from, whose checksum is stored in the index
+			:param dict options: Build options stored in the index (e.g. whether synonyms were integrated)
+		'''
+		meta = {'source_id': self.source_id,
+				'options': options,
+				'source': file_signature(data_path) if data_path is not None else None}
+		self._index.save(cache_path, meta=meta)
+		self._cache_path = cache_path
+
+	def load_cache(self, cache_path, data_path=None, options=None):
+		'''
+			:param str cache_path: Path of the index file
+			:param str data_path: Source data file. If it exists, the index is only loaded if it was built from the same data
+			:param dict options: Build options that the index must have been built with
+			:return: Whether the index was loaded (False if missing, stale or incompatible)
+			:rtype: bool
+		'''
+		if not Path(cache_path).exists():
+			return False
+		try:
+			index = LookupIndex.open(cache_path)
+		except ValueError as e:
+			self.instrumentation.event('cache_rebuild', f'- Ignoring incompatible cache ({e})', path=cache_path, reason='incompatible')
+			return False
+		if options is not None and index.meta.get('options') != options:
+			self.instrumentation.event('cache_rebuild', '- Cache was built with different options, rebuilding', path=cache_path, reason='options')
+			return False
+		source = index.meta.get('source')
+		if data_path is not None and Path(data_path).exists() and (source is None or not signature_matches(source, data_path)):
+			self.instrumentation.event('cache_rebuild', '- Source data changed since the cache was built, rebuilding', path=cache_path, reason='source_changed')
+			return False
+		self._index = index
+		self._cache_path = cache_path
+		return True
 
 
 class EnsemblBiomartMapper(LocalSource):
-	def __init__(self, data_path=None, symb_aliases=True, fill_value='N/A'):
+	data_file = 'ensembl.tsv'
+
+	def __init__(self, data_path=None, symb_aliases=True, fill_value='N/A', pairs=None, persist_tables=False, species='human'):
 		'''
 			:param str data_path: Path where to store the local data for this source (default: internal package folder)
 			:param bool symb_aliases: Whether to download and integrate the symbol aliases and synonyms in the dictionary
 			:param str fill_value: Default value returned when the ID is not found in the source
+			:param list or str pairs: List of (id_in, id_out) lookup tables to build at construction, or 'all'. Other tables are built on first use
+			:param bool persist_tables: Whether to write lookup tables to the cache as they are built, so that later instances start with them
+			:param str species: Species of the genes (see queries.ENSEMBL_DATASETS). The 'hgnc' ID type is only available for human
 		'''
+		self._persist_tables = persist_tables
 		self._source_label = 'Ensembl Biomart'
+		self.species = species
 		if data_path is None:
-			data_path = lib_folder + '/data/ensembl.tsv'
-		cache_path = data_path.replace('.tsv', '.pickle')
-		if Path(cache_path).exists():
-			print('- Loading lookup tables from cache (use function EnsemblBiomartMapper.download_data() to force new download)')
-			self.load_cache(cache_path)
+			data_path = lib_folder + '/data/' + EnsemblBiomartMapper.species_file(species)
+		cache_path = str(Path(data_path).with_suffix('.idx'))
+		options = {'symb_aliases': symb_aliases}
+		if self.load_cache(cache_path, data_path, options):
+			self.instrumentation.event('cache_load', '- Loading lookup tables from cache (use function EnsemblBiomartMapper.download_data() to force new download)', path=cache_path)
 			self.source_id = 'ensembl'
 			self._fill_value = fill_value
 		else:
 			if not Path(data_path).exists():
-				print('- Biomart data has not been downloaded yet.')
-				print(f'- Downloading up-to-date gene annotation data from Ensembl Biomart (http://www.ensembl.org/biomart) to {data_path}.')
-				print('- This operation has to be performed only once and it lasts less than few minutes.')
-				EnsemblBiomartMapper.download_data(data_path)
-				print('- Download completed')
+				self.instrumentation.event('download_start', '- Biomart data has not been downloaded yet.\n'
+										   f'- Downloading up-to-date gene annotation data from Ensembl Biomart (http://www.ensembl.org/biomart) to {data_path}.\n'
+										   '- This operation has to be performed only once and it lasts less than few minutes.', path=data_path)
+				EnsemblBiomartMapper.download_data(data_path, species=species)
+				self.instrumentation.event('download_end', '- Download completed', path=data_path)
 			data = pd.read_table(data_path, sep='\t', dtype={'entr': 'str'})
-			main_data = data[['ensg', 'ensp', 'entr', 'hgnc', 'symb']]
+			main_data = data[[col for col in ['ensg', 'ensp', 'entr', 'hgnc', 'symb'] if col in data.columns]]
 			super().__init__(source_id='ensembl', data=main_data, fill_value=fill_value)
 			if symb_aliases:
 				syn_data = data[['symb', 'synonym']]
 				self.integrate_synonyms(syn_data, 'symb', 'synonym')
-			self.build_cache(cache_path)
+			self.build_cache(cache_path, data_path, options)
+		if pairs is not None:
+			self.warm(None if pairs == 'all' else pairs)
 
 	@staticmethod
-	def download_data(data_path=None):
+	def download_data(data_path=None, url=None, conditional=False, species='human'):
+		'''
+			:param str data_path: Path where to store the local data for this source (default: internal package folder)
+			:param str url: URL of the source data (default: source Biomart query)
+			:param bool conditional: Whether to skip the download if the data did not change since the previous download
+			:param str species: Species of the genes
+			:return: Whether the data was downloaded
+			:rtype: bool
+		'''
 		if data_path is None:
-			data_path = lib_folder + '/data/ensembl.tsv'
-		download_ensembl(data_path)
+			data_path = lib_folder + '/data/' + EnsemblBiomartMapper.species_file(species)
+		return download_ensembl(data_path, url=url, conditional=conditional, species=species)
 
 
 
 class HGNCBiomartMapper(LocalSource):
-	def __init__(self, data_path=None, symb_aliases=True, fill_value='N/A'):
+	data_file = 'hgnc.tsv'
+
+	def __init__(self, data_path=None, symb_aliases=True, fill_value='N/A', pairs=None, persist_tables=False, species='human'):
 		'''
 			:param str data_path: Path where to store the local data for this source (default: internal package folder)
 			:param bool symb_aliases: Whether to download and integrate the symbol aliases and synonyms in the dictionary
 			:param str fill_value: Default value returned when the ID is not found in the source
+			:param list or str pairs: List of (id_in, id_out) lookup tables to build at construction, or 'all'. Other tables are built on first use
+			:param bool persist_tables: Whether to write lookup tables to the cache as they are built, so that later instances start with them
+			:param str species: Species of the genes (only 'human')
 		'''
+		if species != 'human':
+			raise ValueError('HGNC Biomart only provides human genes')
+		self._persist_tables = persist_tables
 		self._source_label = 'HGNC Biomart'
+		self.species = species
 		if data_path is None:
 			data_path = lib_folder + '/data/hgnc.tsv'
-		cache_path = data_path.replace('.tsv', '.pickle')
-		if Path(cache_path).exists():
-			print('- Loading lookup tables from cache (use function HGNCBiomartMapper.download_data() to force new download)')
-			self.load_cache(cache_path)
+		cache_path = str(Path(data_path).with_suffix('.idx'))
+		options = {'symb_aliases': symb_aliases}
+		if self.load_cache(cache_path, data_path, options):
+			self.instrumentation.event('cache_load', '- Loading lookup tables from cache (use function HGNCBiomartMapper.download_data() to force new download)', path=cache_path)
 			self.source_id = 'hgnc'
 			self._fill_value = fill_value
 		else:
 			if not Path(data_path).exists():
-				print('- Biomart data has not been downloaded yet.')
-				print(f'- Downloading up-to-date gene annotation data from HGNC Biomart (http://biomart.genenames.org) to {data_path}.')
-				print('- This operation has to be performed only once and it lasts less than few minutes.')
+				self.instrumentation.event('download_start', '- Biomart data has not been downloaded yet.\n'
+										   f'- Downloading up-to-date gene annotation data from HGNC Biomart (http://biomart.genenames.org) to {data_path}.\n'
+										   '- This operation has to be performed only once and it lasts less than few minutes.', path=data_path)
 				HGNCBiomartMapper.download_data(data_path)
-				print('- Download completed')
+				self.instrumentation.event('download_end', '- Download completed', path=data_path)
 			data = pd.read_table(data_path, sep='\t', dtype={'entr': 'str'})
 			main_data = data[['ensg', 'entr', 'hgnc', 'symb']]
 			syn_data = data[['symb', 'synonym1', 'synonym2']]
@@ -205,28 +340,175 @@ class HGNCBiomartMapper(LocalSource):
 			if symb_aliases:
 				self.integrate_synonyms(syn_data, 'symb', 'synonym1')
 				self.integrate_synonyms(syn_data, 'symb', 'synonym2')
-			self.build_cache(cache_path)
+			self.build_cache(cache_path, data_path, options)
+		if pairs is not None:
+			self.warm(None if pairs == 'all' else pairs)
 
 	@staticmethod
-	def download_data(data_path=None):
+	def download_data(data_path=None, url=None, conditional=False, species='human'):
+		'''
+			:param str data_path: Path where to store the local data for this source (default: internal package folder)
+			:param str url: URL of the source data (default: source Biomart query)
+			:param bool conditional: Whether to skip the download if the data did not change since the previous download
+			:param str species: Species of the genes (only 'human')
+			:return: Whether the data was downloaded
+			:rtype: bool
+		'''
+		if species != 'human':
+			raise ValueError('HGNC Biomart only provides human genes')
 		if data_path is None:
 			data_path = lib_folder + '/data/hgnc.tsv'
-		download_hgnc(data_path)
+		if url is None:
+			return download_hgnc(data_path, conditional=conditional)
+		return download_hgnc(data_path, url=url, conditional=conditional)
+
+class EnsemblOrthologMapper(LocalSource):
+	data_file = 'orthologs.tsv'
+
+	def __init__(self, species_in, species_out, data_path=None, fill_value='N/A'):
+		'''
+			Maps Ensembl gene IDs of a species to the Ensembl gene IDs of their orthologs in another species. The ID
+			types of the source are 'ensg_{species}', e.g. 'ensg_human' and 'ensg_mouse'.
+
+			:param str species_in: Species of the input genes
+			:param str species_out: Species of the orthologs
+			:param str data_path: Path where to store the local data for this source (default: internal package folder)
+			:param str fill_value: Default value returned when the ID is not found in the source
+		'''
+		self._source_label = 'Ensembl Biomart orthologs'
+		self.species = (species_in, species_out)
+		if data_path is None:
+			data_path = lib_folder + f'/data/orthologs_{species_in}_{species_out}.tsv'
+		cache_path = str(Path(data_path).with_suffix('.idx'))
+		options = {'species': [species_in, species_out]}
+		if self.load_cache(cache_path, data_path, options):
+			self.source_id = 'orthologs'
+			self._fill_value = fill_value
+		else:
+			if not Path(data_path).exists():
+				self.instrumentation.event('download_start', f'- Downloading {species_in}-{species_out} orthologs from Ensembl Biomart (http://www.ensembl.org/biomart) to {data_path}.', path=data_path)
+				EnsemblOrthologMapper.download_data(species_in, species_out, data_path)
+				self.instrumentation.event('download_end', '- Download completed', path=data_path)
+			data = pd.read_table(data_path, sep='\t', dtype=str)
+			super().__init__(source_id='orthologs', data=data[[f'ensg_{species_in}', f'ensg_{species_out}']], fill_value=fill_value)
+			self.build_cache(cache_path, data_path, options)
+
+	@classmethod
+	def refresh(cls, species_in, species_out, data_path=None, url=None, force=False, **kwargs):
+		'''
+			Downloads the ortholog table again if it changed on the server since the previous download, and rebuilds
+			the lookup tables only if the data changed.
+
+			:param str species_in: Species of the input genes
+			:param str species_out: Species of the orthologs
+			:param str data_path: Path where the local data for this source is stored (default: internal package folder)
+			:param str url: URL of the source data (default: Biomart homologs query)
+			:param bool force: Whether to download the data even if the server reports no change
+			:param kwargs: Arguments passed to the source constructor
+			:return: Source object and DataFrame of the genes of species_in added, retired and whose first ortholog changed ('renamed'), see utils.change_report()
+			:rtype: tuple
+		'''
+		if data_path is None:
+			data_path = lib_folder + f'/data/orthologs_{species_in}_{species_out}.tsv'
+		key, label = f'ensg_{species_in}', f'ensg_{species_out}'
+		cache_path = str(Path(data_path).with_suffix('.idx'))
+		old = None
+		if Path(cache_path).exists():
+			try:
+				old = LookupIndex.open(cache_path).to_dataframe([key, label])
+			except (ValueError, KeyError):
+				pass
+		if old is None and Path(data_path).exists():
+			old = pd.read_table(data_path, usecols=[key, label], dtype=str)
+		cls.download_data(species_in, species_out, data_path, url=url, conditional=not force)
+		src = cls(species_in, species_out, data_path=data_path, **kwargs)
+		return src, change_report(old, src._index.to_dataframe([key, label]), key=key, label=label)
+
+	@staticmethod
+	def download_data(species_in, species_out, data_path=None, url=None, conditional=False):
+		'''
+			:param str species_in: Species of the input genes
+			:param str species_out: Species of the orthologs
+			:param str data_path: Path where to store the local data for this source (default: internal package folder)
+			:param str url: URL of the source data (default: Biomart homologs query)
+			:param bool conditional: Whether to skip the download if the data did not change since the previous download
+			:return: Whether the data was downloaded
+			:rtype: bool
+		'''
+		if data_path is None:
+			data_path = lib_folder + f'/data/orthologs_{species_in}_{species_out}.tsv'
+		return download_orthologs(data_path, species_in, species_out, url=url, conditional=conditional)
+
 
 class RemoteSource(Source):
+	cost = 100.0
+	expected_coverage = 0.9
+
 	def __init__(self, source_id, fill_value='N/A'):
 		super().__init__(source_id, fill_value=fill_value)
 
 
 class MyGeneMapper(RemoteSource):
 	mg = get_client('gene')
+	id_relabel = {'entr': 'entrezgene', 'symb': 'symbol', 'ensg': 'ensembl.gene', 'ensp':'ensembl.protein', 'hgnc':'HGNC'}
 
-	def __init__(self, fill_value='N/A'):
+	def __init__(self, fill_value='N/A', cache=None, client=None, batch_size=1000, max_workers=4, retries=3, backoff=1.0, species='human'):
 		'''
 			:param str fill_value: Default value returned when the ID is not found in the source
+			:param cache: Persistent cache of the query results. Possible values:
+				- None: No cache (Default)
+				- True: Cache stored in the internal package folder, with default settings
+				- str: Path of the cache database, with default settings
+				- ResultCache object
+			:param client: Biothings client used for the queries (default: shared MyGene client)
+			:param int batch_size: Number of IDs sent in each request
+			:param int max_workers: Maximum number of concurrent requests
+			:param int retries: Number of retries of a failed request
+			:param float backoff: Waiting time before retrying a failed request, in seconds. It doubles at every retry
+			:param str species: Species of the genes, as accepted by MyGene (e.g. 'human', 'mouse', 'rat' or a taxonomy ID)
 		'''
 		self._source_label = 'MyGene'
+		self.species = species
 		super().__init__('mygene', fill_value=fill_value)
+		if cache is True:
+			cache = lib_folder + '/data/mygene_cache.sqlite'
+		if isinstance(cache, (str, Path)):
+			cache = ResultCache(cache)
+		self._cache = cache
+		self._client = client
+		self._batch_size = batch_size
+		self._max_workers = max_workers
+		self._retries = retries
+		self._backoff = backoff
+		self.query_stats = {}
+
+	def query(self, id_list, id_in, id_out):
+		'''
+			:param list id_list: List of distinct IDs to query
+			:param str id_in: Input ID type
+			:param str id_out: Output ID type
+			:return: Dictionary mapping each ID to the output returned by MyGene (None if not found). Throughput statistics of the requests are stored in MyGeneMapper.query_stats
+			:rtype: dict
+		'''
+		client = MyGeneMapper.mg if self._client is None else self._client
+		field = MyGeneMapper.id_relabel[id_out]
+
+		def fetch(batch):
+			return client.getgenes(batch, scopes=MyGeneMapper.id_relabel[id_in], fields=field,
+								   species=self.species, as_dataframe=True, returnall=False)
+
+		with self.instrumentation.stage(f'{self.source_id}.remote', len(id_list)):
+			outputs, self.query_stats = run_batches(fetch, id_list, self._batch_size, max_workers=self._max_workers,
+													retries=self._retries, backoff=self._backoff)
+		self.instrumentation.count(f'{self.source_id}.remote_requests', self.query_stats['batches'] + self.query_stats['retries'])
+		self.instrumentation.count(f'{self.source_id}.remote_retries', self.query_stats['retries'])
+		values = {}
+		for output in outputs:
+			if field in output.columns:
+				output = output[field]
+				output = output[~output.index.duplicated()] # to remove duplicated input IDs in query
+				values.update((id_, value) for id_, value in output.items() if not pd.isna(value))
+		return {id_: str(values[id_]) if id_ in values else None for id_ in id_list}
 
 	def convert(self, id_list, id_in, id_out, multi_hits='first', df=False):
 		'''
@@ -241,18 +523,27 @@ class MyGeneMapper(RemoteSource):
 				:return: List of IDs if df==True, or DataFrame otherwise
 				:rtype: list or DataFrame
 		'''
-		id_list = self.sanitize(id_list, id_in, id_out)
+		ins = self.instrumentation
+		with ins.stage(f'{self.source_id}.sanitize'):
+			id_list = self.sanitize(id_list, id_in, id_out)
+			query = list(dict.fromkeys(id_list))
+		scope, field = MyGeneMapper.id_relabel[id_in], MyGeneMapper.id_relabel[id_out]
 
-		id_relabel = {'entr': 'entrezgene', 'symb': 'symbol', 'ensg': 'ensembl.gene', 'ensp':'ensembl.protein', 'hgnc':'HGNC'}
-		output = MyGeneMapper.mg.getgenes(id_list, scopes=id_relabel[id_in], fields=id_relabel[id_out],
-									species='human', as_dataframe=True, returnall=False)
+		with ins.stage(f'{self.source_id}.cache', len(query)):
+			results = {} if self._cache is None else self._cache.get(query, scope, field, self.species)
+		missing = [id_ for id_ in query if id_ not in results] # only cache misses are sent to MyGene
+		if self._cache is not None:
+			ins.count(f'{self.source_id}.cache_hits', len(results))
+			ins.count(f'{self.source_id}.cache_misses', len(missing))
+		if len(missing) > 0:
+			fetched = self.query(missing, id_in, id_out)
+			if self._cache is not None:
+				self._cache.set(fetched, scope, field, self.species)
+			results.update(fetched)
 
-		if output.shape[1]==1 and 'notfound' in output.columns:
-			out_df = pd.Series([self._fill_value] * len(id_list), index=id_list)
-		else:
-			out_df = output[id_relabel[id_out]].fillna(self._fill_value)
+		out_df = pd.Series([results[id_] for id_ in id_list], index=id_list, dtype=object).fillna(self._fill_value)
+		with ins.stage(f'{self.source_id}.filter_multi_hits', len(out_df)):
 			out_df = self.filter_multi_hits(out_df, multi_hits)
-			out_df = out_df[~out_df.index.duplicated()].reindex(id_list) # to remove duplicated input IDs in query
 		if self._fill_value == 'passthrough':
 			out_df = pd.Series(np.where(out_df == 'passthrough', out_df.index, out_df.values), index=out_df.index)
 		out_df = out_df.astype(str)
@@ -261,6 +552,10 @@ class MyGeneMapper(RemoteSource):
 		else:
 			return out_df.values
 
+	@property
+	def id_types(self):
+		return ['entr', 'ensg', 'symb']
+
 	def has_id_in_type(self, id_type):
 		return id_type in ['entr', 'ensg']
 
@@ -268,8 +563,30 @@ class MyGeneMapper(RemoteSource):
 		return id_type in ['entr', 'ensg', 'symb']
 
 
+def query_source(src, ids, id_in, id_out, multi_hits='first'):
+	'''
+		Converts IDs with a single source. Defined at module level so that it can be submitted to process pools.
+
+		:param Source src: Source object
+		:param ndarray ids: Object array of IDs, as strings
+		:param str id_in: Input ID type
+		:param str id_out: Output ID type
+		:param str multi_hits: Aggregation method for multi hits passed to the source
+		:return: Object array with the output of the source and time spent, in seconds
+		:rtype: tuple
+	'''
+	start = time.perf_counter()
+	if len(ids) == 0:
+		output = np.array([], dtype=object)
+	elif isinstance(src, LocalSource):
+		output = src.convert_array(ids, id_in, id_out, multi_hits=multi_hits)
+	else:
+		output = np.array(src.convert(ids.tolist(), id_in, id_out, multi_hits=multi_hits, df=False), dtype=object)
+	return output, time.perf_counter() - start
+
+
 class IDMapper:
-	def __init__(self, sources, fill_value=None):
+	def __init__(self, sources, fill_value=None, executor=None, multi_hop=True, instrumentation=None, symbol_resolution=None, species='human'):
 		'''
 			:param list or str sources: List of source objects or string with possible values:
 				- 'ensembl_biomart': Ensembl Biomart source (local)
@@ -283,12 +600,37 @@ class IDMapper:
 				- 'passthrough': Return input ID
 				- None: Inherit existing fill values from specified sources
 				- any other string: Return any other string
+			:param executor: Executor used to query the sources concurrently when all of them are needed (consensus and reports). Possible values:
+				- None: A thread pool with one thread per source (Default)
+				- concurrent.futures.Executor object. With a process pool, each source is pickled to the worker at every call (local sources with their lookup tables), and the stages and counters recorded in the workers are not reported
+				- False: Query the sources sequentially
+			:param bool multi_hop: Whether to convert ID type pairs that no source maps directly through intermediate ID types (see IDMapper.plan())
+			:param Instrumentation instrumentation: Instrumentation object recording the stages of the mapper and of its sources (default: biorosetta.instrumentation, shared by all objects)
+			:param str symbol_resolution: How input symbols not found by any source are resolved to the known symbols of the local sources (see SymbolResolver). Possible values:
+				- None: No resolution (Default)
+				- 'normalized': Case, punctuation, Greek letters, spreadsheet dates and stray suffixes
+				- 'fuzzy': As 'normalized', plus misspellings ranked by edit distance
+			:param str species: Species of the sources created when sources is a string (HGNC Biomart is only available for human)
 			:return: IDMapper object
 			:rtype: IDMapper
 		'''
-		sources = IDMapper.get_sources(sources)
+		sources = IDMapper.get_sources(sources, species=species)
+		self.species = species
+		self.last_counts = {}
+		self._executor = executor
 		self._sources = make_list(sources)
 		self._src_ids = [src.source_id for src in self._sources]
+		self._multi_hop = multi_hop
+		self._planner = MappingPlanner(self._sources)
+		self._composites = {}
+		if symbol_resolution not in [None, 'normalized', 'fuzzy']:
+			raise ValueError(f'Symbol resolution specified ({symbol_resolution}) is invalid')
+		self._symbol_resolution = symbol_resolution
+		self._resolver = None
+		self.instrumentation = Source.instrumentation if instrumentation is None else instrumentation
+		if instrumentation is not None:
+			for src in self._sources:
+				src.instrumentation = instrumentation
 		if fill_value is None:
 			self._fill_value = self._sources[0]._fill_value
 		else:
@@ -298,21 +640,23 @@ class IDMapper:
 		
 
 	@staticmethod
-	def get_sources(source='all'):
+	def get_sources(source='all', species='human'):
 
 		if isinstance(source, str):
 			if source == 'ensembl_biomart':
-				return [EnsemblBiomartMapper()]
+				return [EnsemblBiomartMapper(species=species)]
 			elif source == 'hgnc_biomart':
-				return [HGNCBiomartMapper()]
+				return [HGNCBiomartMapper(species=species)]
 			elif source == 'mygene':
-				return [MyGeneMapper()]
+				return [MyGeneMapper(species=species)]
 			elif source == 'all':
-				return [EnsemblBiomartMapper(), HGNCBiomartMapper(), MyGeneMapper()]
+				hgnc = [HGNCBiomartMapper()] if species == 'human' else [] # HGNC only covers human genes
+				return [EnsemblBiomartMapper(species=species)] + hgnc + [MyGeneMapper(species=species)]
 			elif source == 'local':
-				return [EnsemblBiomartMapper(), HGNCBiomartMapper()]
+				hgnc = [HGNCBiomartMapper()] if species == 'human' else []
+				return [EnsemblBiomartMapper(species=species)] + hgnc
 			elif source == 'remote':
-				return [MyGeneMapper()]
+				return [MyGeneMapper(species=species)]
 			else:
 				raise ValueError(f'Source specified ({source}) is invalid')
 		else:
@@ -321,7 +665,68 @@ class IDMapper:
 	def get_source(self, source_id):
 		return self._sources[self._src_ids.index(source_id)]
 
-	def convert(self, id_list, id_in, id_out, multi_hits='first', df=False):
+	def warm(self, pairs='all'):
+		'''
+			Builds the lookup tables of the local sources in advance (see LocalSource.warm()).
+
+			:param list or str pairs: List of (id_in, id_out) tuples, or 'all' (or None) for all the pairs of each source
+		'''
+		for src in self._sources:
+			if not isinstance(src, LocalSource):
+				continue
+			if pairs is None or pairs == 'all':
+				src.warm(None)
+			else:
+				src.warm([(id_in, id_out) for id_in, id_out in pairs if src.has_id_in_type(id_in) and src.has_id_out_type(id_out)])
+
+	def query_sources(self, id_list, id_in, id_out, src_ids, multi_hits='first', cascade=False):
+		'''
+			:param ndarray id_list: Array of distinct IDs to map
+			:param str id_in: Input ID type
+			:param str id_out: Output ID type
+			:param list src_ids: IDs of the sources to query, in priority order
+			:param str multi_hits: Aggregation method for multi hits passed to each source
+			:param bool cascade: Whether each source only receives the IDs not found by the previous ones. Otherwise the sources are queried concurrently (see IDMapper executor)
+			:return: DataFrame with the output of each source (missing for IDs a source was not queried with). The number of IDs queried, found and not found by each source and the time spent by each source are stored in IDMapper.last_counts
+			:rtype: DataFrame
+		'''
+		id_list = as_strings(id_list)
+
+		def run(src_id, positions):
+			output = np.full(len(id_list), None, dtype=object)
+			output[positions], seconds = query_source(self.get_source(src_id), id_list[positions], id_in, id_out, multi_hits)
+			return output, seconds
+
+		results = {}
+		self.last_counts = {}
+		pending = np.arange(len(id_list))
+		if cascade or self._executor is False or len(src_ids) == 1:
+			runs = {}
+			for src_id in src_ids:
+				runs[src_id] = run(src_id, pending)
+				if cascade:
+					self.last_counts[src_id] = {'queried': len(pending)}
+					pending = pending[runs[src_id][0][pending] == self._fill_value]
+		else:
+			executor = ThreadPoolExecutor(max_workers=len(src_ids)) if self._executor is None else self._executor
+			ids = id_list[pending]
+			futures = {src_id: executor.submit(query_source, self.get_source(src_id), ids, id_in, id_out, multi_hits) for src_id in src_ids}
+			runs = {}
+			for src_id, future in futures.items():
+				output, seconds = future.result()
+				runs[src_id] = (np.full(len(id_list), None, dtype=object), seconds)
+				runs[src_id][0][pending] = output
+			if self._executor is None:
+				executor.shutdown()
+		for src_id in src_ids:
+			output, seconds = runs[src_id]
+			found = pd.notna(output) & (output != self._fill_value)
+			queried = self.last_counts.get(src_id, {}).get('queried', len(id_list))
+			self.last_counts[src_id] = {'queried': queried, 'hits': int(found.sum()), 'misses': queried - int(found.sum()), 'seconds': seconds}
+			results[src_id] = output
+		return pd.DataFrame(results, columns=src_ids)
+
+	def convert(self, id_list, id_in, id_out, multi_hits='first', df=False, cascade=None):
 		'''
 			:param list id_list: List of IDs to map
 			:param str id_in: Input ID type
@@ -330,55 +735,295 @@ class IDMapper:
 				- 'first': Returns the first ID returned by each source, and selects the ID from the source with highest priority
 				- 'consensus': Returns the most occurring ID returned by all the sources
 				- 'all': Returns all IDs returned by each source, separated by a pipe ('|') symbol
-			:param bool df: Whether to return a DataFrame with a full reports of the sources responses (True) or just the converted IDs (False)
+			:param bool df: Whether to return a DataFrame with a full reports of the sources responses (True) or just the converted IDs (False). The counts and timings of each source (see IDMapper.last_counts) are stored in the DataFrame attrs['sources']
+			:param bool cascade: Whether each source only receives the IDs not found by higher priority sources. Not available with multi_hits='consensus'. Default (None) is to cascade unless a report is requested. In reports, the output of sources that were not queried for an ID is missing (NaN)
 			:return: List of IDs if df==True, or DataFrame otherwise
 			:rtype: list or DataFrame
 		'''
 		multi_ids = is_list(id_list)
 		id_list = make_list(id_list)
+		if not isinstance(id_list, (list, np.ndarray, pd.Series, pd.Index)):
+			id_list = list(id_list)
+		ins = self.instrumentation
+		with ins.stage('idmapper.dedupe', len(id_list)):
+			codes, unique_ids = factorize_ids(id_list) # each source only converts distinct IDs
+		ins.count('idmapper.ids', len(id_list))
+		ins.count('idmapper.distinct_ids', len(unique_ids))
+		out_df = self.map_distinct(unique_ids, id_in, id_out, multi_hits=multi_hits, df=df, cascade=cascade)
+		if not df:
+			with ins.stage('idmapper.scatter', len(id_list)):
+				output = out_df['output'].values[codes]
+			if multi_ids:
+				return output.tolist()
+			else:
+				return output.tolist()[0]
+		out_df = out_df.iloc[codes].reset_index(drop=True)
+		out_df['input'] = id_list if isinstance(id_list, list) else np.asarray(id_list)
+		out_df.attrs['sources'] = self.last_counts
+		return out_df[['input','output'] + [col for col in out_df.columns.tolist() if col not in ['input','output']]]
+
+	def map_distinct(self, id_list, id_in, id_out, multi_hits='first', df=False, cascade=None, warn=True):
+		'''
+			Maps a list of distinct IDs (see IDMapper.convert() for the parameters).
+
+			:param bool warn: Emit the 'unsupported_sources' event when some sources do not support the mapping
+
+			:return: DataFrame with the output of each source and the final 'output' column, plus the report columns if df==True
+			:rtype: DataFrame
+		'''
 		src_ids = [src_id for src_id, src in zip(self._src_ids, self._sources) if src.has_id_in_type(id_in) and src.has_id_out_type(id_out)]
-		if len(src_ids) < len(self._src_ids):
-			print('One or more sources do not support the requested input/output ID type mapping: {}'.format(','.join(src_id for src_id in self._src_ids if src_id not in src_ids)))
-			print('Mapping will be executed using the following source(s): {}'.format(','.join(src_ids)))
+		if len(src_ids) == 0 and self._multi_hop and ((id_in, id_out) in self._composites or self.plan(id_in, id_out) is not None):
+			return self.map_path(id_list, id_in, id_out, multi_hits=multi_hits, df=df)
+		if warn and len(src_ids) < len(self._src_ids):
+			unsupported = [src_id for src_id in self._src_ids if src_id not in src_ids]
+			self.instrumentation.event('unsupported_sources', 'One or more sources do not support the requested input/output ID type mapping: {}\n'
+									   'Mapping will be executed using the following source(s): {}'.format(','.join(unsupported), ','.join(src_ids)),
+									   id_in=id_in, id_out=id_out, unsupported=unsupported, sources=src_ids)
 		if len(src_ids) == 0:
 			raise ValueError('Input or output ID type not supported by selected sources')
-		out_df = pd.DataFrame([], columns=src_ids)
-		out_df['input'] = id_list
-		for src_id in src_ids:
-			out_df[src_id] = self.get_source(src_id).convert(id_list, id_in, id_out, multi_hits='all' if multi_hits == 'consensus' else multi_hits, df=False)
-
+		if cascade is None:
+			cascade = multi_hits != 'consensus' and not df
+		elif cascade and multi_hits == 'consensus':
+			raise ValueError('Consensus requires querying all the sources')
+		ins = self.instrumentation
+		with ins.stage('idmapper.query_sources', len(id_list)):
+			out_df = self.query_sources(id_list, id_in, id_out, src_ids, multi_hits='all' if multi_hits == 'consensus' else multi_hits, cascade=cascade)
 		if multi_hits == 'consensus':
-			def get_consensus(x):
-				if (x != self._fill_value).sum() > 0:
-					return consensus_elem(x[x != self._fill_value].str.split('|').tolist())
-				else:
-					return self._fill_value
-
-			out_df['output'] = out_df[src_ids].apply(get_consensus,axis=1)
-			#id_list_out = out_df['consensus']
+			with ins.stage('idmapper.consensus', len(id_list)):
+				out_df['output'] = consensus_hits(out_df[src_ids], self._fill_value)
 		else:
-			id_list_out = out_df[src_ids[0]]
-			for i in range(1, len(src_ids)):
-				idx = id_list_out == self._fill_value
-				if idx.sum().squeeze() == 0:
-					break
-				id_list_out[idx] = out_df.loc[idx, src_ids[i]]
-			out_df['output'] = id_list_out
-		out_df.columns = out_df.columns.get_level_values(0)
+			with ins.stage('idmapper.fallback', len(id_list)):
+				id_list_out = out_df[src_ids[0]].copy()
+				for i in range(1, len(src_ids)):
+					idx = id_list_out == self._fill_value
+					if idx.sum().squeeze() == 0:
+						break
+					id_list_out[idx] = out_df.loc[idx, src_ids[i]]
+				out_df['output'] = id_list_out
+		if self._symbol_resolution is not None and id_in == 'symb':
+			with ins.stage('idmapper.resolve', len(id_list)):
+				self.resolve_misses(out_df, id_list, id_out, multi_hits=multi_hits, df=df)
 		if df:
-			if multi_hits == 'consensus' or multi_hits == 'all':
-				out_df['mismatch'] = out_df[src_ids].apply(lambda x: no_intersection(x[x != self._fill_value].values),axis=1)
-			else:
-				out_df['mismatch'] = out_df[src_ids].apply(lambda x: x[x != self._fill_value].nunique() > 1, axis=1)
-			for src_id in src_ids:
-				out_df.loc[out_df[src_id] != 'N/A', f'{src_id}_hits'] = out_df[src_id].str.split('|').apply(lambda x: len(x))
-				out_df.loc[out_df[src_id] == 'N/A', f'{src_id}_hits'] = 0
-			return out_df[['input','output'] + [col for col in out_df.columns.tolist() if col not in ['input','output']]]
+			with ins.stage('idmapper.report', len(id_list)):
+				out_df['mismatch'] = hits_mismatch(out_df[src_ids], self._fill_value, multi_hits=multi_hits == 'consensus' or multi_hits == 'all')
+				for src_id in src_ids:
+					out_df[f'{src_id}_hits'] = np.where(out_df[src_id].notna() & (out_df[src_id] != 'N/A'), out_df[src_id].str.count(r'\|').fillna(0).astype(int) + 1, 0)
+		return out_df
+
+	def resolver(self):
+		'''
+			:return: SymbolResolver over the symbols and synonyms of the local sources, built on first use
+			:rtype: SymbolResolver
+		'''
+		if self._resolver is None:
+			symbols = [src._index.vocabs['symb'].strings for src in self._sources if isinstance(src, LocalSource) and src.has_id_in_type('symb')]
+			if len(symbols) == 0:
+				raise ValueError('Symbol resolution requires a local source with symbols')
+			self._resolver = SymbolResolver(np.concatenate(symbols), fuzzy=self._symbol_resolution == 'fuzzy')
+		return self._resolver
+
+	def resolve_misses(self, out_df, id_list, id_out, multi_hits='first', df=False):
+		'''
+			Maps the input symbols not found by any source through the known symbol they resolve to, updating out_df
+			in place. With df==True, the 'resolved', 'match' and 'confidence' columns are added (see SymbolResolver.resolve()).
+		'''
+		output = out_df['output'].values
+		missing = (output == self._fill_value) | pd.isnull(output)
+		if self._fill_value == 'passthrough':
+			missing |= output == np.asarray(id_list, dtype=object)
+		resolved = pd.DataFrame({'resolved': np.asarray(id_list, dtype=object), 'match': 'exact', 'confidence': 1.0})
+		if missing.any():
+			counts = self.last_counts
+			misses = self.resolver().resolve(np.asarray(id_list, dtype=object)[missing])
+			misses.loc[misses['match'] == 'exact', ['resolved', 'match', 'confidence']] = [np.nan, 'none', 0.0] # known symbols without output
+			found = misses['resolved'].notna().values
+			if found.any():
+				resolution, self._symbol_resolution = self._symbol_resolution, None
+				try:
+					mapped = self.convert(misses['resolved'].values[found].tolist(), 'symb', id_out, multi_hits=multi_hits)
+				finally:
+					self._symbol_resolution = resolution
+				mapped = np.array(mapped, dtype=object)
+				hit = (mapped != self._fill_value) & (mapped != misses['resolved'].values[found])
+				rows = np.flatnonzero(missing)[np.flatnonzero(found)[hit]]
+				output = output.copy()
+				output[rows] = mapped[hit]
+				out_df['output'] = output
+				misses.loc[np.flatnonzero(found)[~hit], ['match', 'confidence']] = ['none', 0.0]
+			misses.loc[misses['match'] == 'none', 'resolved'] = np.nan
+			resolved.loc[missing, ['resolved', 'match', 'confidence']] = misses[['resolved', 'match', 'confidence']].values
+			self.last_counts = dict(counts, resolver={'queried': int(missing.sum()), 'hits': int((misses['match'] != 'none').sum())})
+		if df:
+			out_df[['resolved', 'match', 'confidence']] = resolved.values
+			out_df['confidence'] = out_df['confidence'].astype(float)
+		return out_df
+
+	def plan(self, id_in, id_out):
+		'''
+			:param str id_in: Input ID type
+			:param str id_out: Output ID type
+			:return: ID types along the cheapest conversion path through the sources (None if there is none). The cost of a path is estimated from the cost and the coverage of the sources converting each hop
+			:rtype: list
+		'''
+		return self._planner.plan(id_in, id_out)
+
+	def map_path(self, id_list, id_in, id_out, multi_hits='first', df=False):
+		'''
+			Maps a list of distinct IDs through the conversion path returned by IDMapper.plan(), or through the
+			composite table created by IDMapper.materialize() if available. Intermediate hops keep the first hit.
+
+			:return: DataFrame with the 'output' column, and the intermediate IDs if df==True
+			:rtype: DataFrame
+		'''
+		if (id_in, id_out) in self._composites:
+			src = self._composites[(id_in, id_out)]
+			output = src.convert(id_list, id_in, id_out, multi_hits='all' if multi_hits == 'consensus' else multi_hits)
+			out_df = pd.DataFrame({src.source_id: output})
+			out_df['output'] = out_df[src.source_id]
+			hits = int((out_df['output'] != self._fill_value).sum())
+			self.last_counts = {src.source_id: {'queried': len(id_list), 'hits': hits, 'misses': len(id_list) - hits}}
+			return out_df
+		path = self.plan(id_in, id_out)
+		current = np.array(id_list, dtype=object)
+		found = np.ones(len(current), dtype=bool)
+		out_df = pd.DataFrame(index=range(len(current)))
+		counts = {}
+		for hop_in, hop_out in zip(path[:-1], path[1:]):
+			codes, unique_ids = factorize_ids(current[found])
+			hop_df = self.map_distinct(unique_ids, hop_in, hop_out, multi_hits=multi_hits if hop_out == id_out else 'first', warn=False)
+			output = hop_df['output'].values[codes]
+			counts.update({f'{src_id} ({hop_in}->{hop_out})': src_counts for src_id, src_counts in self.last_counts.items()})
+			hop_found = output != self._fill_value
+			if self._fill_value == 'passthrough':
+				hop_found &= output != current[found]
+			current = np.full(len(current), self._fill_value, dtype=object)
+			current[np.flatnonzero(found)[hop_found]] = output[hop_found]
+			found[np.flatnonzero(found)[~hop_found]] = False
+			if df and hop_out != id_out:
+				out_df[hop_out] = current
+		if self._fill_value == 'passthrough':
+			current[~found] = np.array(id_list, dtype=object)[~found]
+		out_df['output'] = current
+		self.last_counts = counts
+		return out_df
+
+	def materialize(self, id_in, id_out):
+		'''
+			Converts all the IDs of type id_in known to the local sources through the conversion path of the pair,
+			and stores the result as a composite table used by later conversions, so that they run at the speed of a
+			single lookup.
+
+			:param str id_in: Input ID type
+			:param str id_out: Output ID type
+			:return: Number of input IDs in the composite table
+			:rtype: int
+		'''
+		if self.plan(id_in, id_out) is None:
+			raise ValueError('Input or output ID type not supported by selected sources')
+		id_list = pd.unique(np.concatenate([src._index.vocabs[id_in].strings for src in self._sources
+											if isinstance(src, LocalSource) and src.has_id_in_type(id_in)] + [np.array([], dtype=object)]))
+		self._composites.pop((id_in, id_out), None)
+		output = self.map_path(list(id_list), id_in, id_out, multi_hits='all')['output'].values
+		mapped = (output != self._fill_value) & (output != id_list)
+		pairs = pd.DataFrame({id_in: id_list[mapped], id_out: output[mapped]})
+		pairs[id_out] = pairs[id_out].str.split('|')
+		pairs = pairs.explode(id_out)
+		self._composites[(id_in, id_out)] = LocalSource(f'{id_in}2{id_out}', pairs, fill_value=self._fill_value)
+		return int(mapped.sum())
+
+	def convert_values(self, values, id_in, id_out, multi_hits='first'):
+		'''
+			Converts an array of IDs without going through Python lists, returning the same type of container.
+			Each distinct ID is converted once. Categorical inputs are converted once per category and returned
+			as categorical.
+
+			:param values: pandas Series or Index, numpy array or pyarrow array of IDs
+			:param str id_in: Input ID type
+			:param str id_out: Output ID type
+			:param str multi_hits: Aggregation method for multi hits (see IDMapper.convert(), except 'consensus')
+			:return: Converted IDs, with the same type, index and name as the input
+			:rtype: Series, Index, ndarray or pyarrow Array
+		'''
+		arrow = not isinstance(values, (pd.Series, pd.Index, np.ndarray)) and hasattr(values, 'to_pandas')
+		ids = values.to_pandas() if arrow else values
+		codes, unique_ids = factorize_ids(ids)
+		converted = self.map_distinct(unique_ids, id_in, id_out, multi_hits=multi_hits)['output'].values.astype(object)
+		if isinstance(getattr(ids, 'dtype', None), pd.CategoricalDtype):
+			out_codes, categories = pd.factorize(converted)
+			output = pd.Categorical.from_codes(out_codes[codes], categories)
 		else:
-			if multi_ids:
-				return out_df['output'].tolist()
-			else:
-				return out_df['output'].tolist()[0]
+			output = converted[codes]
+		if arrow:
+			import pyarrow as pa
+			return pa.array(output)
+		if isinstance(values, pd.Series):
+			return pd.Series(output, index=values.index, name=values.name)
+		if isinstance(values, pd.Index):
+			return pd.Index(output, name=values.name)
+		return np.asarray(output)
+
+	def relabel(self, data, id_in, id_out, axis=0, multi_hits='first', drop_unmapped=False):
+		'''
+			Converts the IDs used as index or columns of a DataFrame (e.g. the genes of an expression matrix).
+
+			:param DataFrame data: DataFrame to relabel
+			:param str id_in: Input ID type
+			:param str id_out: Output ID type
+			:param int axis: 0 to convert the index, 1 to convert the columns
+			:param str multi_hits: Aggregation method for multi hits (see IDMapper.convert(), except 'consensus')
+			:param bool drop_unmapped: Whether to drop the rows (or columns) whose ID was not found
+			:return: DataFrame with the converted labels
+			:rtype: DataFrame
+		'''
+		labels = self.convert_values(data.axes[axis], id_in, id_out, multi_hits=multi_hits)
+		data = data.set_axis(labels, axis=axis)
+		if drop_unmapped:
+			mapped = np.asarray(labels != self._fill_value)
+			data = data.loc[mapped] if axis == 0 else data.loc[:, mapped]
+		return data
+
+	def convert_iter(self, id_iter, id_in, id_out, multi_hits='first', df=False, chunk_size=100000):
+		'''
+			Converts IDs from an iterable in chunks, so that the input never needs to be held in memory.
+
+			:param id_iter: Iterable of IDs to map
+			:param str id_in: Input ID type
+			:param str id_out: Output ID type
+			:param str multi_hits: Aggregation method for multi hits (see IDMapper.convert())
+			:param bool df: Whether to yield reports (True) or lists of converted IDs (False)
+			:param int chunk_size: Number of IDs converted at a time
+			:return: Generator of the converted chunks, in input order
+			:rtype: generator
+		'''
+		for chunk in iter_chunks(id_iter, chunk_size):
+			yield self.convert(chunk, id_in, id_out, multi_hits=multi_hits, df=df)
+
+	def convert_file(self, input_path, output_path, column, id_in, id_out, multi_hits='first', out_column=None, chunk_size=100000):
+		'''
+			Converts a column of a table, reading and writing it in chunks. Tab-separated (.tsv, .txt), comma-separated
+			(.csv), gzip-compressed (.gz) and parquet (.parquet, requires pyarrow) files are supported.
+
+			:param str input_path: Input table
+			:param str output_path: Output table, with the input columns followed by the converted IDs
+			:param str column: Column of the input table with the IDs to map
+			:param str id_in: Input ID type
+			:param str id_out: Output ID type
+			:param str multi_hits: Aggregation method for multi hits (see IDMapper.convert())
+			:param str out_column: Name of the column with the converted IDs (default: id_out)
+			:param int chunk_size: Number of rows converted at a time
+			:return: Number of rows written
+			:rtype: int
+		'''
+		out_column = id_out if out_column is None else out_column
+
+		def converted_chunks():
+			for chunk in read_table_chunks(input_path, chunk_size):
+				if column not in chunk.columns:
+					raise ValueError(f'Column {column} not found in {input_path}')
+				chunk[out_column] = self.convert(chunk[column].tolist(), id_in, id_out, multi_hits=multi_hits)
+				yield chunk
+
+		return write_table_chunks(converted_chunks(), output_path)
 
 	def entr2ensg(self, id_list, df=False):
 		return self.convert(id_list, id_in='entr', id_out='ensg', df=df)
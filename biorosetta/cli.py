@@ -0,0 +1,175 @@
+import argparse
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from .classes import IDMapper, EnsemblBiomartMapper, HGNCBiomartMapper, MyGeneMapper, LocalSource
+from .instrument import instrumentation
+
+SOURCES = {'ensembl_biomart': EnsemblBiomartMapper, 'hgnc_biomart': HGNCBiomartMapper, 'mygene': MyGeneMapper}
+PRESETS = {'all': ['ensembl_biomart', 'hgnc_biomart', 'mygene'], 'local': ['ensembl_biomart', 'hgnc_biomart'], 'remote': ['mygene']}
+
+_mapper = None # mapper of the worker processes, inherited from the parent process when forking
+
+
+def source_names(sources, species='human'):
+	'''
+		:param str sources: Comma-separated source names or presets ('all', 'local', 'remote')
+		:param str species: Species. HGNC Biomart is left out of the presets for other species than human
+		:return: Source names
+		:rtype: list
+	'''
+	names = []
+	for name in sources.split(','):
+		if name in PRESETS:
+			names += [preset for preset in PRESETS[name] if species == 'human' or preset != 'hgnc_biomart']
+		elif name in SOURCES:
+			names.append(name)
+		else:
+			raise ValueError(f'Source specified ({name}) is invalid')
+	return list(dict.fromkeys(names))
+
+
+def make_source(name, species='human', data_dir=None, mygene_cache=None, **kwargs):
+	cls = SOURCES[name]
+	if cls is MyGeneMapper:
+		return MyGeneMapper(cache=mygene_cache, species=species)
+	data_path = None if data_dir is None else str(Path(data_dir) / cls.species_file(species))
+	return cls(data_path=data_path, species=species, **kwargs)
+
+
+def make_mapper(options):
+	sources = [make_source(name, options['species'], options['data_dir'], options['mygene_cache'])
+			   for name in source_names(options['sources'], options['species'])]
+	return IDMapper(sources, fill_value=options['fill_value'], symbol_resolution=options['symbol_resolution'], species=options['species'])
+
+
+def output_paths(inputs, output):
+	'''
+		:param list inputs: Input tables
+		:param str output: Output table if there is one input, or output folder
+		:return: Output table of each input. Inputs with the same file name are rejected, as they would overwrite each other
+		:rtype: list
+	'''
+	if output is None:
+		raise ValueError('Output path not specified')
+	if len(inputs) == 1 and not Path(output).is_dir():
+		outputs = [Path(output)]
+	else:
+		outputs = [Path(output) / Path(path).name for path in inputs]
+	seen = {}
+	for path, out in zip(inputs, outputs):
+		if Path(path).resolve() == out.resolve():
+			raise ValueError(f'Output path is the same as the input path ({path})')
+		if out.resolve() in seen:
+			raise ValueError(f'Inputs {seen[out.resolve()]} and {path} would both be written to {out}')
+		seen[out.resolve()] = path
+	return outputs
+
+
+def _init_worker(options):
+	global _mapper
+	if _mapper is None:
+		instrumentation.verbose = False
+		_mapper = make_mapper(options)
+
+
+def _convert_file(input_path, output_path, args):
+	start = time.perf_counter()
+	n_rows = _mapper.convert_file(input_path, output_path, args['column'], args['id_in'], args['id_out'], multi_hits=args['multi_hits'],
+								  out_column=args['out_column'], chunk_size=args['chunk_size'])
+	return n_rows, time.perf_counter() - start
+
+
+def convert(args):
+	global _mapper
+	outputs = output_paths(args.inputs, args.output)
+	if len(args.inputs) > 1:
+		Path(args.output).mkdir(parents=True, exist_ok=True)
+	options = {key: getattr(args, key) for key in ['sources', 'species', 'data_dir', 'mygene_cache', 'fill_value', 'symbol_resolution']}
+	file_args = {key: getattr(args, key) for key in ['column', 'id_in', 'id_out', 'multi_hits', 'out_column', 'chunk_size']}
+	_mapper = make_mapper(options) # loaded once: forked workers share its memory-mapped tables
+	_mapper.warm([(args.id_in, args.id_out)])
+	jobs = min(args.jobs, len(args.inputs))
+	if jobs <= 1:
+		results = [_convert_file(path, out, file_args) for path, out in zip(args.inputs, outputs)]
+	else:
+		context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+		with ProcessPoolExecutor(max_workers=jobs, mp_context=context, initializer=_init_worker, initargs=(options,)) as executor:
+			futures = [executor.submit(_convert_file, path, out, file_args) for path, out in zip(args.inputs, outputs)]
+			results = [future.result() for future in futures]
+	for path, out, (n_rows, seconds) in zip(args.inputs, outputs, results):
+		print(f'- {path} -> {out}: {n_rows} rows in {seconds:.2f}s')
+
+
+def build_index(args):
+	for name in source_names(args.sources, args.species):
+		if not issubclass(SOURCES[name], LocalSource):
+			continue
+		start = time.perf_counter()
+		src = make_source(name, args.species, args.data_dir, pairs='all', persist_tables=True)
+		print(f'- {name}: {src._cache_path} ({src.nbytes() / 2 ** 20:.1f} MB) in {time.perf_counter() - start:.2f}s')
+
+
+def refresh(args):
+	for name in source_names(args.sources, args.species):
+		cls = SOURCES[name]
+		if not issubclass(cls, LocalSource):
+			continue
+		data_path = None if args.data_dir is None else str(Path(args.data_dir) / cls.species_file(args.species))
+		src, changes = cls.refresh(data_path=data_path, force=args.force, species=args.species, pairs='all', persist_tables=True)
+		counts = changes['change'].value_counts()
+		print(f'- {name}: ' + ', '.join(f'{counts.get(change, 0)} {change}' for change in ['added', 'retired', 'renamed']))
+		if args.report_dir is not None:
+			Path(args.report_dir).mkdir(parents=True, exist_ok=True)
+			changes.to_csv(Path(args.report_dir) / f'{name}_{args.species}_changes.tsv', sep='\t', index=False)
+
+
+def parser():
+	parser = argparse.ArgumentParser(prog='biorosetta', description='Convert gene identifiers between different naming conventions')
+	common = argparse.ArgumentParser(add_help=False)
+	common.add_argument('--sources', default='local', help='Comma-separated sources (ensembl_biomart, hgnc_biomart, mygene) or presets (all, local, remote). Default: local')
+	common.add_argument('--species', default='human', help='Species of the genes. Default: human')
+	common.add_argument('--data-dir', help='Folder of the source data and caches. Default: internal package folder')
+	common.add_argument('--quiet', action='store_true', help='Do not print the messages of the sources')
+	subparsers = parser.add_subparsers(dest='command', required=True)
+
+	conv = subparsers.add_parser('convert', parents=[common], help='Convert a column of one or more TSV/CSV/Parquet tables (optionally gzipped)')
+	conv.add_argument('inputs', nargs='+', help='Input tables')
+	conv.add_argument('-o', '--output', required=True, help='Output table, or output folder if there are several inputs')
+	conv.add_argument('--column', required=True, help='Column with the IDs to convert')
+	conv.add_argument('--id-in', required=True, help='Input ID type (ensg, entr, symb, ensp, hgnc)')
+	conv.add_argument('--id-out', required=True, help='Output ID type (ensg, entr, symb, ensp, hgnc)')
+	conv.add_argument('--multi-hits', default='first', choices=['first', 'all', 'shortest', 'consensus'], help='Aggregation method for multi hits. Default: first')
+	conv.add_argument('--out-column', help='Column with the converted IDs. Default: the output ID type')
+	conv.add_argument('--fill-value', default='N/A', help='Value of the IDs not found ("passthrough" to keep the input ID). Default: N/A')
+	conv.add_argument('--symbol-resolution', choices=['normalized', 'fuzzy'], help='Resolve input symbols not found by any source')
+	conv.add_argument('--mygene-cache', help='Path of the MyGene results cache')
+	conv.add_argument('--chunk-size', type=int, default=100000, help='Number of rows converted at a time. Default: 100000')
+	conv.add_argument('-j', '--jobs', type=int, default=1, help='Number of files converted in parallel. Default: 1')
+	conv.set_defaults(func=convert)
+
+	build = subparsers.add_parser('build-index', parents=[common], help='Download the source data if missing and build all the lookup tables of the local sources')
+	build.set_defaults(func=build_index)
+
+	ref = subparsers.add_parser('refresh', parents=[common], help='Download the source data again if it changed and rebuild the lookup tables')
+	ref.add_argument('--force', action='store_true', help='Download the data even if the server reports no change')
+	ref.add_argument('--report-dir', help='Folder where to write the genes added, retired and renamed by each source')
+	ref.set_defaults(func=refresh)
+	return parser
+
+
+def main(argv=None):
+	args = parser().parse_args(argv)
+	if args.quiet:
+		instrumentation.verbose = False
+	try:
+		args.func(args)
+	except (ValueError, OSError) as e:
+		sys.exit(f'biorosetta: error: {e}')
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,535 @@
+import json
+import mmap
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+MAGIC = b'BRIDX\x00'
+SCHEMA_VERSION = 3
+_ALIGN = 64
+
+
+def _to_bytes(values):
+	values = np.asarray(values, dtype=object).astype(str)
+	try:
+		return values.astype(bytes)
+	except UnicodeEncodeError:
+		return np.char.encode(values, 'utf-8')
+
+
+def _to_str(values):
+	try:
+		return values.astype(str).astype(object)
+	except UnicodeDecodeError:
+		return np.char.decode(values, 'utf-8').astype(object)
+
+
+class Vocabulary:
+	'''
+		Interned string table for a single ID type. Each distinct ID is stored once and referred to by its integer code.
+	'''
+	def __init__(self, strings=()):
+		self._strings = np.asarray(strings, dtype=object)
+		self._index = None
+		self._lengths = None
+
+	def __len__(self):
+		return len(self._strings)
+
+	@property
+	def strings(self):
+		return self._strings
+
+	@property
+	def index(self):
+		if self._index is None:
+			self._index = pd.Index(self._strings, dtype=object)
+		return self._index
+
+	@property
+	def lengths(self):
+		if self._lengths is None:
+			self._lengths = np.fromiter(map(len, self.strings), dtype=np.int32, count=len(self))
+		return self._lengths
+
+	def encode(self, values):
+		'''
+			:param list values: IDs to encode
+			:return: Integer codes of the IDs (-1 for IDs not in the vocabulary)
+			:rtype: ndarray
+		'''
+		return self.index.get_indexer(values)
+
+	def decode(self, codes):
+		return self._strings[codes]
+
+	def extend(self, values):
+		'''
+			Adds the IDs that are not yet in the vocabulary, keeping the codes of the existing ones.
+
+			:param list values: IDs to add
+			:return: Integer codes of the IDs
+			:rtype: ndarray
+		'''
+		values = np.asarray(values, dtype=object)
+		codes = self.encode(values)
+		new = pd.unique(values[codes == -1])
+		if len(new) > 0:
+			self._strings = np.concatenate([self._strings, new])
+			self._index = None
+			self._lengths = None
+			codes = self.encode(values)
+		return codes
+
+	def nbytes(self):
+		'''
+			:return: Approximate memory used by the vocabulary, in bytes (Python strings have about 50 bytes of overhead)
+			:rtype: int
+		'''
+		return self._strings.nbytes + int(self.lengths.sum()) + 50 * len(self)
+
+	def sorted_keys(self):
+		'''
+			:return: The IDs as UTF-8 bytes in sorted order, the code of each sorted ID and the sorted position of each code
+			:rtype: tuple
+		'''
+		keys = _to_bytes(self._strings) if len(self._strings) > 0 else np.array([], dtype='S1')
+		order = np.argsort(keys, kind='stable')
+		rank = np.empty(len(order), dtype=np.int32)
+		rank[order] = np.arange(len(order), dtype=np.int32)
+		return keys[order], order.astype(np.int32), rank
+
+
+class MappedVocabulary(Vocabulary):
+	'''
+		Read-only vocabulary backed by a sorted key block. IDs are resolved by binary search instead of a hash
+		table, so that the arrays can be memory-mapped and shared between processes.
+	'''
+	def __init__(self, keys, codes, rank):
+		self._keys = keys
+		self._codes = codes
+		self._rank = rank
+		self._lengths = None
+
+	def __len__(self):
+		return len(self._keys)
+
+	@property
+	def strings(self):
+		return self.decode(np.arange(len(self)))
+
+	def encode(self, values):
+		if len(self._keys) == 0:
+			return np.full(len(values), -1, dtype=np.int64)
+		values = _to_bytes(values)
+		pos = np.minimum(np.searchsorted(self._keys, values), len(self._keys) - 1)
+		return np.where(self._keys[pos] == values, self._codes[pos], -1).astype(np.int64)
+
+	def decode(self, codes):
+		return _to_str(self._keys[self._rank[codes]])
+
+	def extend(self, values):
+		raise ValueError('Memory-mapped vocabularies are read-only')
+
+	def nbytes(self):
+		return self._keys.nbytes + self._codes.nbytes + self._rank.nbytes
+
+	def sorted_keys(self):
+		return self._keys, self._codes, self._rank
+
+
+class Mapping:
+	'''
+		Many-to-many mapping between the codes of two vocabularies, stored in CSR layout: the output codes of
+		input code i are targets[offsets[i]:offsets[i+1]], in the order they appear in the source data.
+		The shortest output of each input code is materialized when the lookup table is built.
+	'''
+	def __init__(self, offsets, targets, shortest=None):
+		self.offsets = offsets
+		self.targets = targets
+		self.shortest = shortest
+
+	@classmethod
+	def from_pairs(cls, keys, values, n_keys, order=None):
+		'''
+			:param ndarray keys: Input codes
+			:param ndarray values: Output codes, aligned to keys. Order is preserved within each key
+			:param int n_keys: Size of the input vocabulary
+			:param ndarray order: Stable sorting order of keys, if already known
+			:return: Mapping object
+			:rtype: Mapping
+		'''
+		if order is None:
+			order = np.argsort(keys, kind='stable')
+		offsets = np.zeros(n_keys + 1, dtype=np.int64)
+		np.cumsum(np.bincount(keys, minlength=n_keys), out=offsets[1:])
+		return cls(offsets, values[order].astype(np.int32))
+
+	@property
+	def n_keys(self):
+		return len(self.offsets) - 1
+
+	def __len__(self):
+		return int((np.diff(self.offsets) > 0).sum())
+
+	def starts(self, codes):
+		codes = np.asarray(codes)
+		valid = (codes >= 0) & (codes < self.n_keys)
+		starts = np.zeros(len(codes), dtype=np.int64)
+		starts[valid] = self.offsets[codes[valid]]
+		return starts
+
+	def counts(self, codes):
+		'''
+			:param ndarray codes: Input codes (-1 or codes beyond the mapped range are allowed)
+			:return: Number of output codes for each input code
+			:rtype: ndarray
+		'''
+		codes = np.asarray(codes)
+		valid = (codes >= 0) & (codes < self.n_keys)
+		counts = np.zeros(len(codes), dtype=np.int64)
+		counts[valid] = self.offsets[codes[valid] + 1] - self.offsets[codes[valid]]
+		return counts
+
+	def row(self, code):
+		return self.targets[self.offsets[code]:self.offsets[code + 1]]
+
+	def shortest_hits(self, lengths):
+		'''
+			:param ndarray lengths: Length of each output ID
+			:return: Output code with the shortest ID for each input code (first in source order on ties, -1 if none)
+			:rtype: ndarray
+		'''
+		counts = np.diff(self.offsets)
+		rows = np.repeat(np.arange(self.n_keys), counts)
+		order = np.lexsort((lengths[self.targets], rows))
+		winners = np.full(self.n_keys, -1, dtype=np.int32)
+		winners[counts > 0] = self.targets[order[self.offsets[:-1][counts > 0]]]
+		return winners
+
+	def alias(self, keys, sources, n_keys):
+		'''
+			Returns a new mapping where each key without outputs inherits the outputs of its source code.
+
+			:param ndarray keys: Alias codes (unique)
+			:param ndarray sources: Codes whose outputs are copied, aligned to keys
+			:param int n_keys: Size of the input vocabulary after the aliases have been added
+			:return: Mapping object
+			:rtype: Mapping
+		'''
+		counts = self.counts(np.arange(n_keys))
+		sel = (counts[keys] == 0) & (counts[sources] > 0)
+		keys, sources = keys[sel], sources[sel]
+		src_of = np.arange(n_keys)
+		src_of[keys] = sources
+		counts[keys] = counts[sources]
+		offsets = np.zeros(n_keys + 1, dtype=np.int64)
+		np.cumsum(counts, out=offsets[1:])
+		starts = self.starts(src_of)
+		idx = np.repeat(starts - offsets[:-1], counts) + np.arange(offsets[-1])
+		return Mapping(offsets, self.targets[idx])
+
+
+class LookupIndex:
+	'''
+		Lookup engine for a local source. The source table is stored column-wise as integer codes into one
+		Vocabulary per ID type, and every (id_in, id_out) pair is a Mapping between those codes.
+	'''
+	def __init__(self, vocabs, columns, tables=None, aliases=None, meta=None):
+		self.vocabs = vocabs
+		self._columns = columns
+		self._tables = {} if tables is None else tables
+		self._aliases = [] if aliases is None else aliases
+		self._row_orders = {}
+		self.meta = {} if meta is None else meta
+
+	@classmethod
+	def from_dataframe(cls, data):
+		'''
+			:param DataFrame data: Source table, with one column per ID type
+			:return: LookupIndex object
+			:rtype: LookupIndex
+		'''
+		vocabs = {}
+		columns = {}
+		for id_type in data.columns:
+			codes, uniques = pd.factorize(data[id_type])
+			vocabs[id_type] = Vocabulary(uniques)
+			columns[id_type] = codes.astype(np.int32)
+		return cls(vocabs, columns)
+
+	@property
+	def id_types(self):
+		return list(self._columns.keys())
+
+	def to_dataframe(self, id_types=None):
+		'''
+			:param list id_types: Columns to decode (default: all)
+			:return: Source table the index was built from
+			:rtype: DataFrame
+		'''
+		id_types = self.id_types if id_types is None else id_types
+		data = {}
+		for id_type in id_types:
+			codes = self._columns[id_type]
+			column = np.full(len(codes), None, dtype=object)
+			column[codes >= 0] = self.vocabs[id_type].decode(codes[codes >= 0])
+			data[id_type] = column
+		return pd.DataFrame(data, columns=id_types)
+
+	def pairs(self):
+		return [(id_in, id_out) for id_in in self.id_types for id_out in self.id_types if id_in != id_out]
+
+	def has_table(self, id_in, id_out):
+		return (id_in, id_out) in self._tables
+
+	def table(self, id_in, id_out):
+		'''
+			Returns the mapping for a pair of ID types, building it on first use.
+
+			:param str id_in: Input ID type
+			:param str id_out: Output ID type
+			:return: Mapping object
+			:rtype: Mapping
+		'''
+		if (id_in, id_out) not in self._tables:
+			self._tables[(id_in, id_out)] = self.new_table(id_in, id_out)
+		return self._tables[(id_in, id_out)]
+
+	def coverage(self, id_in, id_out):
+		'''
+			Estimates the fraction of input IDs that can be mapped without building the table: the fraction of the
+			rows with an input ID that also have an output ID.
+
+			:param str id_in: Input ID type
+			:param str id_out: Output ID type
+			:return: Estimated coverage, between 0 and 1
+			:rtype: float
+		'''
+		has_in = self._columns[id_in] >= 0
+		return int((has_in & (self._columns[id_out] >= 0)).sum()) / max(1, int(has_in.sum()))
+
+	def build_tables(self, pairs=None, max_workers=None):
+		'''
+			Builds the missing tables of several pairs concurrently. The tables are independent and most of
+			their build time is spent in numpy sorts, which release the GIL.
+
+			:param list pairs: List of (id_in, id_out) tuples (default: all pairs)
+			:param int max_workers: Maximum number of threads (default: one per core)
+			:return: Pairs whose table was built
+			:rtype: list
+		'''
+		pairs = [pair for pair in (self.pairs() if pairs is None else pairs) if pair not in self._tables]
+		for id_out in set(id_out for _, id_out in pairs):
+			self.vocabs[id_out].lengths # computed once, before the threads
+		max_workers = os.cpu_count() if max_workers is None else max_workers
+		if len(pairs) <= 1 or max_workers <= 1:
+			tables = [self.new_table(id_in, id_out) for id_in, id_out in pairs]
+		else:
+			with ThreadPoolExecutor(max_workers=max_workers) as executor:
+				list(executor.map(self.row_order, set(id_in for id_in, _ in pairs)))
+				tables = list(executor.map(lambda pair: self.new_table(*pair), pairs))
+		self._tables.update(zip(pairs, tables))
+		for id_in in list(self._row_orders): # row orders are only needed until all tables of the input type are built
+			if all(self.has_table(id_in, id_out) for id_out in self.id_types if id_out != id_in):
+				del self._row_orders[id_in]
+		return pairs
+
+	def new_table(self, id_in, id_out):
+		table = self.build_table(id_in, id_out)
+		for id_orig, keys, sources in self._aliases:
+			if id_orig == id_in:
+				table = table.alias(keys, sources, len(self.vocabs[id_in]))
+		table.shortest = table.shortest_hits(self.vocabs[id_out].lengths)
+		return table
+
+	def row_order(self, id_type):
+		'''
+			:param str id_type: ID type
+			:return: Stable sorting order of the rows by their code of id_type, shared by the tables with the same input type
+			:rtype: ndarray
+		'''
+		if id_type not in self._row_orders:
+			self._row_orders[id_type] = np.argsort(self._columns[id_type], kind='stable').astype(np.int32)
+		return self._row_orders[id_type]
+
+	def build_table(self, id_in, id_out):
+		cin, cout = self._columns[id_in], self._columns[id_out]
+		keep = (cin >= 0) & (cout >= 0)
+		pair_keys = np.where(keep, cin.astype(np.int64) * len(self.vocabs[id_out]) + cout, -1)
+		keep &= ~pd.Series(pair_keys).duplicated().values # first occurrence of each pair
+		order = self.row_order(id_in)
+		order = order[keep[order]] # rows kept, grouped by input code in source order
+		position = np.cumsum(keep) - 1
+		return Mapping.from_pairs(cin[keep], cout[keep], len(self.vocabs[id_in]), order=position[order])
+
+	def add_synonyms(self, data, id_orig, id_synonym):
+		'''
+			Makes the synonyms resolve to the outputs of their original ID, for every output type. Synonyms
+			that are already IDs of the same type or that refer to more than one original ID are ignored.
+			Tables built later apply the synonyms in the order they were added.
+
+			:param DataFrame data: Table with id_orig and id_synonym columns
+			:param str id_orig: ID type of the original IDs
+			:param str id_synonym: Column containing the synonyms
+		'''
+		pruned = data[data[id_orig].notna() & data[id_synonym].notna()]
+		pruned = pruned[~pruned.duplicated(subset=[id_orig, id_synonym])]
+		pruned = pruned[~pruned.duplicated(subset=[id_synonym], keep=False)]
+		vocab = self.vocabs[id_orig]
+		orig = vocab.encode(pruned[id_orig].values)
+		pruned, orig = pruned[orig >= 0], orig[orig >= 0]
+		syn = vocab.extend(pruned[id_synonym].values)
+		keys, sources = syn.astype(np.int32), orig.astype(np.int32)
+		self._aliases.append((id_orig, keys, sources))
+		for (id_in, id_out), table in self._tables.items():
+			if id_in == id_orig:
+				table = table.alias(keys, sources, len(vocab))
+				table.shortest = table.shortest_hits(self.vocabs[id_out].lengths)
+				self._tables[(id_in, id_out)] = table
+
+	def lookup(self, id_list, id_in, id_out, multi_hits='first'):
+		'''
+			:param list id_list: List of IDs to map
+			:param str id_in: Input ID type
+			:param str id_out: Output ID type
+			:param multi_hits: 'first', 'shortest', a function selecting one ID from a list of hits, or any other value to join all the hits with a pipe ('|') symbol
+			:return: Array with the mapped IDs (None for IDs not found)
+			:rtype: ndarray
+		'''
+		table = self.table(id_in, id_out)
+		vocab_out = self.vocabs[id_out]
+		codes = self.vocabs[id_in].encode(id_list)
+		counts = table.counts(codes)
+		output = np.full(len(codes), None, dtype=object)
+		found = counts > 0
+		if multi_hits == 'shortest':
+			output[found] = vocab_out.decode(table.shortest[codes[found]])
+			return output
+		output[found] = vocab_out.decode(table.targets[table.offsets[codes[found]]])
+		if multi_hits == 'first':
+			return output
+		multi = np.flatnonzero(counts > 1)
+		keys, inverse = np.unique(codes[multi], return_inverse=True)
+		resolved = np.empty(len(keys), dtype=object)
+		for i, code in enumerate(keys):
+			hits = vocab_out.decode(table.row(code))
+			resolved[i] = multi_hits(hits.tolist()) if callable(multi_hits) else '|'.join(hits)
+		output[multi] = resolved[inverse]
+		return output
+
+	def nbytes(self):
+		'''
+			:return: Memory used by the vocabularies, columns and tables, in bytes. Memory-mapped arrays are counted in full, although they are shared between processes and only loaded as they are read
+			:rtype: int
+		'''
+		arrays = list(self._columns.values()) + [array for _, keys, sources in self._aliases for array in [keys, sources]]
+		for table in self._tables.values():
+			arrays += [table.offsets, table.targets] + ([] if table.shortest is None else [table.shortest])
+		return sum(vocab.nbytes() for vocab in self.vocabs.values()) + sum(array.nbytes for array in arrays)
+
+	def sizes(self):
+		self.build_tables()
+		return {pair: len(self.table(*pair)) for pair in self.pairs()}
+
+	def save(self, path, meta=None):
+		'''
+			Writes the index in the binary format read by LookupIndex.open(). The file is a fixed preamble (magic
+			bytes, schema version, header length), a JSON header describing every array, and the arrays themselves
+			aligned to 64 bytes. The file is written to a temporary path and moved in place, so readers never see
+			a partial index.
+
+			:param str path: Output path
+			:param dict meta: JSON-serializable metadata stored in the header (e.g. source data checksum)
+		'''
+		if meta is not None:
+			self.meta = meta
+		arrays = {}
+		for id_type, vocab in self.vocabs.items():
+			keys, codes, rank = vocab.sorted_keys()
+			arrays[f'vocab/{id_type}/keys'] = keys
+			arrays[f'vocab/{id_type}/codes'] = codes
+			arrays[f'vocab/{id_type}/rank'] = rank
+		for id_type, column in self._columns.items():
+			arrays[f'column/{id_type}'] = column
+		for (id_in, id_out), table in self._tables.items():
+			arrays[f'table/{id_in}/{id_out}/offsets'] = table.offsets
+			arrays[f'table/{id_in}/{id_out}/targets'] = table.targets
+			arrays[f'table/{id_in}/{id_out}/shortest'] = table.shortest
+		for i, (id_orig, keys, sources) in enumerate(self._aliases):
+			arrays[f'alias/{i}/keys'] = keys
+			arrays[f'alias/{i}/sources'] = sources
+
+		directory = {}
+		offset = 0
+		for name, array in arrays.items():
+			array = np.ascontiguousarray(array)
+			arrays[name] = array
+			directory[name] = [offset, array.dtype.str, list(array.shape)]
+			offset += -(-array.nbytes // _ALIGN) * _ALIGN
+		header = json.dumps({'schema_version': SCHEMA_VERSION,
+							 'id_types': self.id_types,
+							 'tables': [list(pair) for pair in self._tables],
+							 'aliases': [id_orig for id_orig, _, _ in self._aliases],
+							 'arrays': directory,
+							 'meta': self.meta}).encode()
+		start = -(-(len(MAGIC) + 12 + len(header)) // _ALIGN) * _ALIGN
+
+		tmp_path = f'{path}.{os.getpid()}.tmp'
+		with open(tmp_path, 'wb') as f:
+			f.write(MAGIC)
+			f.write(np.array([SCHEMA_VERSION], dtype='<u4').tobytes())
+			f.write(np.array([len(header)], dtype='<u8').tobytes())
+			f.write(header)
+			for name, array in arrays.items():
+				f.seek(start + directory[name][0])
+				f.write(array.tobytes())
+		os.replace(tmp_path, path)
+
+	@staticmethod
+	def read_header(path):
+		'''
+			:param str path: Index path
+			:return: Header of the index file and offset of the array section
+			:rtype: tuple
+		'''
+		with open(path, 'rb') as f:
+			if f.read(len(MAGIC)) != MAGIC:
+				raise ValueError(f'{path} is not a biorosetta index')
+			version = int(np.frombuffer(f.read(4), dtype='<u4')[0])
+			if version != SCHEMA_VERSION:
+				raise ValueError(f'{path} has schema version {version} (expected {SCHEMA_VERSION})')
+			length = int(np.frombuffer(f.read(8), dtype='<u8')[0])
+			header = json.loads(f.read(length))
+		return header, -(-(len(MAGIC) + 12 + length) // _ALIGN) * _ALIGN
+
+	@classmethod
+	def open(cls, path):
+		'''
+			Opens an index written by LookupIndex.save(). Arrays are memory-mapped read-only, so opening is
+			independent of the index size and the pages are shared by all the processes using the same file.
+
+			:param str path: Index path
+			:return: LookupIndex object
+			:rtype: LookupIndex
+		'''
+		header, start = cls.read_header(path)
+		with open(path, 'rb') as f:
+			buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+		def array(name):
+			offset, dtype, shape = header['arrays'][name]
+			count = int(np.prod(shape))
+			if count == 0:
+				return np.empty(shape, dtype=dtype)
+			return np.frombuffer(buffer, dtype=dtype, count=count, offset=start + offset).reshape(shape)
+
+		vocabs = {id_type: MappedVocabulary(array(f'vocab/{id_type}/keys'), array(f'vocab/{id_type}/codes'),
+											array(f'vocab/{id_type}/rank')) for id_type in header['id_types']}
+		columns = {id_type: array(f'column/{id_type}') for id_type in header['id_types']}
+		tables = {(id_in, id_out): Mapping(array(f'table/{id_in}/{id_out}/offsets'), array(f'table/{id_in}/{id_out}/targets'),
+										   array(f'table/{id_in}/{id_out}/shortest'))
+				  for id_in, id_out in header['tables']}
+		aliases = [(id_orig, array(f'alias/{i}/keys'), array(f'alias/{i}/sources')) for i, id_orig in enumerate(header['aliases'])]
+		return cls(vocabs, columns, tables, aliases, meta=header['meta'])
@@ -0,0 +1,116 @@
+import threading
+import time
+
+import pandas as pd
+
+
+class _Stage:
+	def __init__(self, instrumentation, name, items):
+		self._instrumentation = instrumentation
+		self._name = name
+		self._items = items
+
+	def __enter__(self):
+		self._start = time.perf_counter()
+		return self
+
+	def __exit__(self, *exc):
+		self._instrumentation.record(self._name, time.perf_counter() - self._start, self._items)
+
+
+class _NullStage:
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		pass
+
+
+_null_stage = _NullStage()
+
+
+class Instrumentation:
+	'''
+		Records the wall time and number of items of the conversion stages (e.g. 'hgnc.lookup', 'idmapper.consensus'),
+		counters (e.g. 'mygene.cache_hits', 'mygene.remote_requests') and events (e.g. 'cache_rebuild'). Stages and
+		counters are only recorded when enabled, so that disabled instrumentation costs a function call per stage.
+		Events are always passed to the callbacks, and their message is printed if verbose.
+
+		Callbacks are called as callback(kind, name, fields), with kind one of 'stage', 'count' or 'event', e.g. to
+		export the stages to Prometheus or to a logger.
+	'''
+	def __init__(self, enabled=False, verbose=True, callbacks=None):
+		'''
+			:param bool enabled: Whether to record stages and counters
+			:param bool verbose: Whether to print the messages of the events
+			:param list callbacks: Functions called for every stage, counter and event recorded
+			:return: Instrumentation object
+			:rtype: Instrumentation
+		'''
+		self.enabled = enabled
+		self.verbose = verbose
+		self.callbacks = [] if callbacks is None else list(callbacks)
+		self._lock = threading.Lock()
+		self.reset()
+
+	def __getstate__(self):
+		return {key: value for key, value in self.__dict__.items() if key != '_lock'}
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self._lock = threading.Lock()
+
+	def reset(self):
+		self.stages = {}
+		self.counters = {}
+
+	def stage(self, name, items=0):
+		'''
+			:param str name: Name of the stage
+			:param int items: Number of items processed by the stage
+			:return: Context manager timing the stage
+		'''
+		if not self.enabled:
+			return _null_stage
+		return _Stage(self, name, items)
+
+	def record(self, name, seconds, items=0):
+		with self._lock:
+			stage = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'items': 0})
+			stage['calls'] += 1
+			stage['seconds'] += seconds
+			stage['items'] += items
+		for callback in self.callbacks:
+			callback('stage', name, {'seconds': seconds, 'items': items})
+
+	def count(self, name, n=1):
+		if not self.enabled:
+			return
+		with self._lock:
+			self.counters[name] = self.counters.get(name, 0) + n
+		for callback in self.callbacks:
+			callback('count', name, {'n': n})
+
+	def event(self, name, message=None, **fields):
+		'''
+			:param str name: Name of the event
+			:param str message: Message printed if verbose
+			:param fields: Data of the event passed to the callbacks
+		'''
+		if self.verbose and message is not None:
+			print(message)
+		for callback in self.callbacks:
+			callback('event', name, dict(fields, message=message))
+
+	def summary(self):
+		'''
+			:return: DataFrame with the number of calls, total time, number of items and throughput of each stage
+			:rtype: DataFrame
+		'''
+		with self._lock:
+			summary = pd.DataFrame.from_dict(self.stages, orient='index', columns=['calls', 'seconds', 'items'])
+		summary['items_per_second'] = summary['items'].where(summary['items'] > 0) / summary['seconds'].where(summary['seconds'] > 0)
+		return summary.rename_axis('stage').sort_values('seconds', ascending=False)
+
+
+instrumentation = Instrumentation()
@@ -0,0 +1,83 @@
+import heapq
+import itertools
+
+import numpy as np
+
+
+class MappingPlanner:
+	'''
+		Plans conversions between ID types that no source maps directly, by composing conversions through
+		intermediate ID types (e.g. symb -> ensg -> entr). Each hop is converted by all the sources supporting
+		it, in priority order, so a hop can be answered by a different source than the previous one.
+	'''
+	def __init__(self, sources, max_hops=3):
+		'''
+			:param list sources: Source objects, in priority order
+			:param int max_hops: Maximum number of conversions in a path
+			:return: MappingPlanner object
+			:rtype: MappingPlanner
+		'''
+		self._sources = sources
+		self._max_hops = max_hops
+		self._plans = {}
+		self._edges = {}
+
+	def id_types(self):
+		id_types = []
+		for src in self._sources:
+			id_types += [id_type for id_type in src.id_types if id_type not in id_types]
+		return id_types
+
+	def edge(self, id_in, id_out):
+		'''
+			:param str id_in: Input ID type
+			:param str id_out: Output ID type
+			:return: Estimated cost and coverage of the conversion with the sources supporting it (None if no source does)
+			:rtype: tuple
+		'''
+		if (id_in, id_out) not in self._edges:
+			supporting = [src for src in self._sources if src.has_id_in_type(id_in) and src.has_id_out_type(id_out)]
+			if len(supporting) == 0:
+				self._edges[(id_in, id_out)] = None
+			else:
+				miss = np.prod([1 - src.coverage(id_in, id_out) for src in supporting])
+				self._edges[(id_in, id_out)] = (supporting[0].cost, 1 - miss)
+		return self._edges[(id_in, id_out)]
+
+	def plan(self, id_in, id_out):
+		'''
+			Selects the path with the lowest expected cost per mapped ID, i.e. the sum of the hop costs divided by
+			the product of the hop coverages. Paths are expanded best first: extending a path can only raise its
+			score, so the first complete path reached is the best one, and only the hops of the paths expanded
+			until then are estimated.
+
+			:param str id_in: Input ID type
+			:param str id_out: Output ID type
+			:return: ID types along the path, from id_in to id_out (None if there is no path)
+			:rtype: list
+		'''
+		if (id_in, id_out) not in self._plans:
+			self._plans[(id_in, id_out)] = self.search(id_in, id_out)
+		return self._plans[(id_in, id_out)]
+
+	def search(self, id_in, id_out):
+		if not any(src.has_id_in_type(id_in) for src in self._sources) or not any(src.has_id_out_type(id_out) for src in self._sources):
+			return None
+		id_types = self.id_types()
+		order = itertools.count() # ties are expanded in insertion order
+		queue = [(0.0, next(order), 0.0, 1.0, [id_in])]
+		while len(queue) > 0:
+			_, _, cost, coverage, path = heapq.heappop(queue)
+			if path[-1] == id_out:
+				return path
+			if len(path) > self._max_hops:
+				continue
+			for id_type in id_types:
+				if id_type in path:
+					continue
+				edge = self.edge(path[-1], id_type)
+				if edge is None or edge[1] <= 0:
+					continue
+				hop_cost, hop_coverage = cost + edge[0], coverage * edge[1]
+				heapq.heappush(queue, (hop_cost / hop_coverage, next(order), hop_cost, hop_coverage, path + [id_type]))
+		return None
@@ -0,0 +1,169 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from .index import Mapping
+
+GREEK = {'α': 'A', 'β': 'B', 'γ': 'G', 'δ': 'D', 'ε': 'E', 'ζ': 'Z', 'θ': 'Q', 'κ': 'K', 'λ': 'L', 'μ': 'M', 'σ': 'S', 'ω': 'W'}
+GREEK_NAMES = {'ALPHA': 'A', 'BETA': 'B', 'GAMMA': 'G', 'DELTA': 'D', 'EPSILON': 'E', 'ZETA': 'Z', 'THETA': 'Q',
+			   'KAPPA': 'K', 'LAMBDA': 'L', 'SIGMA': 'S', 'OMEGA': 'W'}
+# symbols turned into dates by spreadsheets, by month: prefixes of the current and previous symbols
+EXCEL_MONTHS = {'JAN': ['JAN'], 'FEB': ['FEB'], 'MAR': ['MARCHF', 'MARCH', 'MAR'], 'APR': ['APR'], 'MAY': ['MAY'],
+				'JUN': ['JUN'], 'JUL': ['JUL'], 'AUG': ['AUG'], 'SEP': ['SEPTIN', 'SEPT', 'SEP'], 'SEPT': ['SEPTIN', 'SEPT', 'SEP'],
+				'OCT': ['OCT'], 'NOV': ['NOV'], 'DEC': ['DELEC', 'DEC']}
+_excel_day_month = re.compile(r'^0?(\d{1,2})-([A-Za-z]{3,4})$')
+_excel_month_day = re.compile(r'^([A-Za-z]{3,4})-0?(\d{1,2})$')
+_suffix = re.compile(r'^(.+?)[-_ ](AS|IT|OT|DT)\d*$', re.IGNORECASE)
+_greek_names = re.compile('|'.join(GREEK_NAMES))
+_punctuation = re.compile(r'[^0-9A-Z]')
+_greek_table = str.maketrans(GREEK)
+
+
+def _greek_name(match):
+	return GREEK_NAMES[match.group()]
+
+
+def normalize_symbol(symbol):
+	'''
+		:param str symbol: Gene symbol
+		:return: Case-folded symbol, with Greek letters and their names replaced by latin letters and punctuation removed
+		:rtype: str
+	'''
+	return _punctuation.sub('', _greek_names.sub(_greek_name, symbol.lower().translate(_greek_table).upper()))
+
+
+def normalize_symbols(symbols):
+	'''
+		:param Series symbols: Gene symbols
+		:return: Normalized symbols (see normalize_symbol())
+		:rtype: Series
+	'''
+	symbols = symbols.str.lower().str.translate(_greek_table).str.upper()
+	return symbols.str.replace(_greek_names, _greek_name, regex=True).str.replace(_punctuation, '', regex=True)
+
+
+def edit_distance(a, b):
+	previous = list(range(len(b) + 1))
+	for i, ca in enumerate(a, 1):
+		current = [i]
+		for j, cb in enumerate(b, 1):
+			current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+		previous = current
+	return previous[-1]
+
+
+class SymbolResolver:
+	'''
+		Resolves gene symbols that do not match any known symbol exactly: case and punctuation differences,
+		Greek letters, spreadsheet date corruptions (e.g. '7-Sep' for SEPT7), stray suffixes (e.g. '-AS1') and,
+		optionally, misspellings. Known symbols are indexed by normalized key, for constant-time lookups, and by
+		character trigrams, to rank fuzzy candidates by similarity.
+	'''
+	confidence = {'exact': 1.0, 'normalized': 0.95, 'excel_date': 0.9, 'suffix': 0.6}
+
+	def __init__(self, symbols, fuzzy=True, min_similarity=0.75, max_candidates=5):
+		'''
+			:param list symbols: Known symbols (including synonyms), in priority order
+			:param bool fuzzy: Whether to match misspelled symbols by edit distance
+			:param float min_similarity: Minimum similarity (1 - edit distance / length) of a fuzzy match
+			:param int max_candidates: Number of candidates sharing the most trigrams compared by edit distance
+			:return: SymbolResolver object
+			:rtype: SymbolResolver
+		'''
+		self.symbols = pd.Index(pd.unique(np.asarray(symbols, dtype=object)))
+		self.fuzzy = fuzzy
+		self.min_similarity = min_similarity
+		self.max_candidates = max_candidates
+		self._candidates = {}
+		for key, symbol in zip(normalize_symbols(pd.Series(self.symbols, dtype=object)), self.symbols):
+			self._candidates.setdefault(key, []).append(symbol)
+		self._keys = None
+		self._trigrams = None
+
+	def build_trigrams(self):
+		'''
+			Builds the trigram index of the normalized keys used by fuzzy matching, on its first use.
+		'''
+		self._keys = np.array(list(self._candidates), dtype=object)
+		grams = [self.trigrams(key) for key in self._keys]
+		self._n_grams = np.array([len(g) for g in grams], dtype=np.int64)
+		gram_codes, self._gram_vocab = pd.factorize(pd.Series([gram for g in grams for gram in g], dtype=object))
+		self._gram_vocab = pd.Index(self._gram_vocab)
+		self._trigrams = Mapping.from_pairs(gram_codes, np.repeat(np.arange(len(self._keys)), self._n_grams), len(self._gram_vocab))
+
+	@staticmethod
+	def trigrams(key):
+		key = f'^{key}$'
+		return list(dict.fromkeys(key[i:i + 3] for i in range(len(key) - 2)))
+
+	def pick(self, key, match, confidence=None):
+		candidates = self._candidates[key]
+		confidence = self.confidence[match] if confidence is None else confidence
+		return candidates[0], match, confidence / len(candidates) # ambiguous keys lower the confidence
+
+	def match_fuzzy(self, key):
+		if self._trigrams is None:
+			self.build_trigrams()
+		codes = self._gram_vocab.get_indexer(self.trigrams(key))
+		codes = codes[codes >= 0]
+		if len(codes) == 0:
+			return None
+		hits = np.concatenate([self._trigrams.row(code) for code in codes])
+		candidates, shared = np.unique(hits, return_counts=True)
+		dice = 2 * shared / (len(self.trigrams(key)) + self._n_grams[candidates])
+		best = None
+		for candidate in candidates[np.argsort(-dice, kind='stable')[:self.max_candidates]]:
+			other = self._keys[candidate]
+			similarity = 1 - edit_distance(key, other) / max(len(key), len(other))
+			if similarity >= self.min_similarity and (best is None or similarity > best[1]):
+				best = (other, similarity)
+		if best is None:
+			return None
+		return self.pick(best[0], 'fuzzy', 0.8 * best[1])
+
+	def match(self, symbol):
+		'''
+			:param str symbol: Gene symbol
+			:return: Known symbol, rule that matched it ('exact', 'normalized', 'excel_date', 'suffix' or 'fuzzy') and confidence, or None
+			:rtype: tuple
+		'''
+		if symbol in self.symbols:
+			return symbol, 'exact', self.confidence['exact']
+		date = _excel_day_month.match(symbol) or _excel_month_day.match(symbol)
+		if date is not None:
+			day, month = date.groups() if date.re is _excel_day_month else date.groups()[::-1]
+			for prefix in EXCEL_MONTHS.get(month.upper(), []):
+				if prefix + day in self._candidates:
+					return self.pick(prefix + day, 'excel_date')
+		key = normalize_symbol(symbol)
+		if key in self._candidates:
+			return self.pick(key, 'normalized')
+		suffix = _suffix.match(symbol)
+		if suffix is not None and normalize_symbol(suffix.group(1)) in self._candidates:
+			return self.pick(normalize_symbol(suffix.group(1)), 'suffix')
+		if self.fuzzy and len(key) >= 3:
+			return self.match_fuzzy(key)
+		return None
+
+	def resolve(self, id_list):
+		'''
+			:param list id_list: Gene symbols
+			:return: DataFrame with the known symbol each input resolves to ('resolved', NaN if none), the rule that matched it ('match') and its confidence (0 if none)
+			:rtype: DataFrame
+		'''
+		codes, unique_ids = pd.factorize(pd.Series(id_list, dtype=object).astype(str))
+		symbols = pd.Series(unique_ids, dtype=object)
+		keys = normalize_symbols(symbols).values
+		known = self.symbols.get_indexer(symbols) >= 0
+		dates = (symbols.str.match(_excel_day_month) | symbols.str.match(_excel_month_day)).values
+		matches = []
+		for symbol, key, is_known, is_date in zip(symbols, keys, known, dates): # fast path for exact and normalized matches
+			if is_known:
+				matches.append((symbol, 'exact', self.confidence['exact']))
+			elif not is_date and key in self._candidates:
+				matches.append(self.pick(key, 'normalized'))
+			else:
+				matches.append(self.match(symbol) or (np.nan, 'none', 0.0))
+		resolved = pd.DataFrame(matches, columns=['resolved', 'match', 'confidence'])
+		return resolved.iloc[codes].reset_index(drop=True)
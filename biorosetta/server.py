@@ -0,0 +1,170 @@
+import threading
+from multiprocessing import current_process
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client, answer_challenge, deliver_challenge
+
+from .classes import IDMapper
+
+
+class MapperServer:
+	'''
+		Serves an IDMapper to other processes over a local socket (a Unix socket on Linux/macOS), so that the lookup
+		tables are loaded once per host and workers attach with a MapperClient. Each message carries a batch of
+		calls, which are answered with a single message.
+
+		Requests are unpickled by the server, so clients are always authenticated with a key. By default this is the
+		authkey of the current process, which is inherited by the worker processes started with multiprocessing, so
+		they connect without passing it. Other processes must pass MapperServer.authkey to their MapperClient.
+	'''
+	methods = ['convert', 'plan', 'entr2ensg', 'entr2symb', 'ensg2entr', 'ensg2symb', 'symb2entr', 'symb2ensg']
+
+	def __init__(self, mapper='local', address=None, authkey=None, pairs=None):
+		'''
+			:param mapper: IDMapper object or sources accepted by IDMapper
+			:param str address: Address of the socket (default: new temporary Unix socket)
+			:param bytes authkey: Key used to authenticate the clients (default: multiprocessing authkey of the current process)
+			:param list pairs: (id_in, id_out) pairs whose lookup tables are built before serving ('all' for all pairs)
+			:return: MapperServer object
+			:rtype: MapperServer
+		'''
+		self.mapper = mapper if isinstance(mapper, IDMapper) else IDMapper(mapper)
+		if pairs is not None:
+			self.mapper.warm(pairs)
+		self.authkey = current_process().authkey if authkey is None else authkey
+		if len(self.authkey) == 0:
+			raise ValueError('Authentication key must not be empty')
+		self._listener = Listener(address) # clients are authenticated in their own thread, see MapperServer.handle()
+		self.address = self._listener.address
+		self._lock = threading.Lock()
+		self._thread = None
+		self._closed = False
+
+	def call(self, method, args, kwargs):
+		if method not in self.methods:
+			raise ValueError(f'Method {method} not supported')
+		with self._lock:
+			return getattr(self.mapper, method)(*args, **kwargs)
+
+	def handle(self, conn):
+		with conn:
+			try:
+				deliver_challenge(conn, self.authkey)
+				answer_challenge(conn, self.authkey)
+			except (AuthenticationError, EOFError, OSError):
+				return
+			while True:
+				try:
+					calls = conn.recv()
+				except (EOFError, OSError):
+					return
+				results = []
+				for method, args, kwargs in calls:
+					try:
+						results.append(('ok', self.call(method, args, kwargs)))
+					except Exception as e:
+						results.append(('error', e))
+				conn.send(results)
+
+	def serve_forever(self):
+		'''
+			Accepts clients until the server is closed, handling each connection in its own thread.
+		'''
+		while not self._closed:
+			try:
+				conn = self._listener.accept()
+			except OSError:
+				if self._closed:
+					return
+				continue
+			threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+	def start(self):
+		'''
+			Serves in a background thread.
+
+			:return: Address of the server
+			:rtype: str
+		'''
+		self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+		self._thread.start()
+		return self.address
+
+	def close(self):
+		self._closed = True
+		self._listener.close()
+
+	def __enter__(self):
+		self.start()
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+
+class MapperClient:
+	'''
+		Client of a MapperServer, exposing the conversion methods of IDMapper. Callable multi_hits are not supported,
+		as the calls are pickled to the server.
+	'''
+	def __init__(self, address, authkey=None):
+		'''
+			:param str address: Address of the server
+			:param bytes authkey: Key of the server (default: multiprocessing authkey of the current process, see MapperServer)
+			:return: MapperClient object
+			:rtype: MapperClient
+		'''
+		self.address = address
+		self._conn = Client(address, authkey=current_process().authkey if authkey is None else authkey)
+		self._lock = threading.Lock()
+
+	def batch(self, calls):
+		'''
+			Sends several calls in one message.
+
+			:param list calls: List of (method, args, kwargs) tuples, e.g. ('convert', (id_list, 'symb', 'ensg'), {'multi_hits': 'all'})
+			:return: Results of the calls, in the same order
+			:rtype: list
+		'''
+		with self._lock:
+			self._conn.send([(method, tuple(args), dict(kwargs)) for method, args, kwargs in calls])
+			results = self._conn.recv()
+		for status, value in results:
+			if status == 'error':
+				raise value
+		return [value for status, value in results]
+
+	def call(self, method, *args, **kwargs):
+		return self.batch([(method, args, kwargs)])[0]
+
+	def convert(self, id_list, id_in, id_out, multi_hits='first', df=False, cascade=None):
+		return self.call('convert', id_list, id_in, id_out, multi_hits=multi_hits, df=df, cascade=cascade)
+
+	def plan(self, id_in, id_out):
+		return self.call('plan', id_in, id_out)
+
+	def entr2ensg(self, id_list, df=False):
+		return self.convert(id_list, id_in='entr', id_out='ensg', df=df)
+
+	def entr2symb(self, id_list, df=False):
+		return self.convert(id_list, id_in='entr', id_out='symb', df=df)
+
+	def ensg2entr(self, id_list, df=False):
+		return self.convert(id_list, id_in='ensg', id_out='entr', df=df)
+
+	def ensg2symb(self, id_list, df=False):
+		return self.convert(id_list, id_in='ensg', id_out='symb', df=df)
+
+	def symb2entr(self, id_list, df=False):
+		return self.convert(id_list, id_in='symb', id_out='entr', df=df)
+
+	def symb2ensg(self, id_list, df=False):
+		return self.convert(id_list, id_in='symb', id_out='ensg', df=df)
+
+	def close(self):
+		self._conn.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
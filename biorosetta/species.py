@@ -0,0 +1,129 @@
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .classes import IDMapper, LocalSource, EnsemblOrthologMapper
+
+
+class SpeciesMapper:
+	'''
+		Maps IDs of several species, and between orthologs of different species. The sources of each species and
+		the ortholog tables are loaded on first use, from the memory-mapped caches of the local sources, and the least
+		recently used ones are released when the memory of the loaded lookup tables exceeds a budget.
+	'''
+	def __init__(self, sources='local', fill_value='N/A', memory_budget=None, data_folder=None, **kwargs):
+		'''
+			:param sources: Sources of each species, as accepted by IDMapper ('local', 'all', ...), or function returning the list of source objects of a species
+			:param str fill_value: Value to return when output ID is not found (see IDMapper)
+			:param int memory_budget: Maximum memory of the loaded lookup tables, in bytes (default: no limit). The mapper in use is never released
+			:param str data_folder: Folder of the ortholog tables (default: internal package folder)
+			:param kwargs: Arguments passed to IDMapper
+			:return: SpeciesMapper object
+			:rtype: SpeciesMapper
+		'''
+		self._sources = sources
+		self._fill_value = fill_value
+		self._memory_budget = memory_budget
+		self._data_folder = data_folder
+		self._kwargs = kwargs
+		self._loaded = OrderedDict()
+		self.evictions = 0
+
+	def load(self, key, factory):
+		if key in self._loaded:
+			self._loaded.move_to_end(key)
+			return self._loaded[key]
+		self._loaded[key] = factory()
+		if self._memory_budget is not None:
+			while len(self._loaded) > 1 and sum(self.memory_usage().values()) > self._memory_budget:
+				self._loaded.popitem(last=False)
+				self.evictions += 1
+		return self._loaded[key]
+
+	def mapper(self, species='human'):
+		'''
+			:param str species: Species
+			:return: IDMapper with the sources of the species
+			:rtype: IDMapper
+		'''
+		def factory():
+			sources = self._sources(species) if callable(self._sources) else IDMapper.get_sources(self._sources, species=species)
+			return IDMapper(sources, fill_value=self._fill_value, species=species, **self._kwargs)
+		return self.load(species, factory)
+
+	def ortholog_source(self, species_in, species_out):
+		'''
+			:param str species_in: Species of the input genes
+			:param str species_out: Species of the orthologs
+			:return: Source mapping Ensembl gene IDs of species_in to their orthologs in species_out
+			:rtype: EnsemblOrthologMapper
+		'''
+		data_path = None if self._data_folder is None else str(Path(self._data_folder) / f'orthologs_{species_in}_{species_out}.tsv')
+		return self.load((species_in, species_out), lambda: EnsemblOrthologMapper(species_in, species_out, data_path=data_path, fill_value=self._fill_value))
+
+	def memory_usage(self):
+		'''
+			:return: Memory used by the lookup tables of each loaded species or ortholog table, in bytes
+			:rtype: dict
+		'''
+		usage = {}
+		for key, loaded in self._loaded.items():
+			sources = loaded._sources if isinstance(loaded, IDMapper) else [loaded]
+			usage[key] = sum(src.nbytes() for src in sources if isinstance(src, LocalSource))
+		return usage
+
+	def convert(self, id_list, id_in, id_out, species='human', multi_hits='first', df=False):
+		'''
+			:param list id_list: List of IDs to map
+			:param str id_in: Input ID type
+			:param str id_out: Output ID type
+			:param str species: Species of the IDs
+			:param str multi_hits: Aggregation method for multi hits (see IDMapper.convert())
+			:param bool df: Whether to return a DataFrame with a full report (see IDMapper.convert())
+			:return: List of IDs if df==False, or DataFrame otherwise
+			:rtype: list or DataFrame
+		'''
+		return self.mapper(species).convert(id_list, id_in, id_out, multi_hits=multi_hits, df=df)
+
+	def orthologs(self, id_list, species_in, species_out, id_in='ensg', id_out='ensg', multi_hits='first', df=False):
+		'''
+			Maps IDs of a species to the IDs of their orthologs in another species, through the Ensembl gene IDs of both
+			species. Intermediate conversions keep the first hit.
+
+			:param list id_list: List of IDs to map
+			:param str species_in: Species of the input IDs
+			:param str species_out: Species of the output IDs
+			:param str id_in: Input ID type
+			:param str id_out: Output ID type
+			:param str multi_hits: Aggregation method for the multi hits of the last conversion ('first', 'all' or 'shortest')
+			:param bool df: Whether to return a DataFrame with the intermediate Ensembl gene IDs
+			:return: List of IDs if df==False, or DataFrame otherwise
+			:rtype: list or DataFrame
+		'''
+		id_list = list(id_list)
+		steps = [(species_in, id_in, 'ensg'), ('orthologs', f'ensg_{species_in}', f'ensg_{species_out}'), (species_out, 'ensg', id_out)]
+		steps = [step for step in steps if step[1] != step[2]]
+		current = np.array(id_list, dtype=object)
+		found = np.ones(len(current), dtype=bool)
+		report = pd.DataFrame({'input': current})
+		for i, (step, step_in, step_out) in enumerate(steps):
+			hits = multi_hits if i == len(steps) - 1 else 'first'
+			if step == 'orthologs':
+				source = self.ortholog_source(species_in, species_out)
+				output = np.array(source.convert(current[found].tolist(), step_in, step_out, multi_hits=hits), dtype=object)
+			else:
+				output = np.array(self.mapper(step).convert(current[found].tolist(), step_in, step_out, multi_hits=hits), dtype=object)
+			hit = (output != self._fill_value) & (output != current[found])
+			current = np.full(len(current), self._fill_value, dtype=object)
+			current[np.flatnonzero(found)[hit]] = output[hit]
+			found[np.flatnonzero(found)[~hit]] = False
+			if df and i < len(steps) - 1:
+				report[step_out if step == 'orthologs' else f'{step_out}_{step}'] = current
+		if self._fill_value == 'passthrough':
+			current[~found] = np.array(id_list, dtype=object)[~found]
+		if not df:
+			return current.tolist()
+		report['output'] = current
+		return report[['input', 'output'] + [col for col in report.columns if col not in ['input', 'output']]]
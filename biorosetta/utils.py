@@ -2,24 +2,152 @@ import requests
 from tqdm import tqdm
 import collections
 from . import queries
+from .instrument import instrumentation
 import pandas as pd
+import numpy as np
+import hashlib
+import json
+import os
+import time
+import gzip
+import itertools
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-def download(url: str, fname: str):
+def download(url: str, fname: str, conditional=False, chunk_size=1 << 20):
+	'''
+		:param str url: URL to download
+		:param str fname: Output path
+		:param bool conditional: Whether to skip the download if the server reports that the file did not change since the previous download (ETag/Last-Modified)
+		:param int chunk_size: Size of the chunks written to disk, in bytes
+		:return: Whether the file was downloaded
+		:rtype: bool
+	'''
 	Path(fname).parent.mkdir(parents=True, exist_ok=True)
-	resp = requests.get(url, stream=True)
+	meta_path = fname + '.http.json'
+	headers = {'Accept-Encoding': 'gzip, deflate'} # compressed transfer, decoded while streaming
+	if conditional and Path(fname).exists() and Path(meta_path).exists():
+		with open(meta_path) as f:
+			meta = json.load(f)
+		if meta.get('url') == url and meta.get('etag') is not None:
+			headers['If-None-Match'] = meta['etag']
+		if meta.get('url') == url and meta.get('last_modified') is not None:
+			headers['If-Modified-Since'] = meta['last_modified']
+	resp = requests.get(url, stream=True, headers=headers)
+	if resp.status_code == 304:
+		return False
+	resp.raise_for_status()
 	total = int(resp.headers.get('content-length', 0))
-	# Can also replace 'file' with a io.BytesIO object
-	with open(fname, 'wb') as file, tqdm(
+	tmp_fname = fname + '.part'
+	with open(tmp_fname, 'wb') as file, tqdm(
 		desc=fname,
 		total=total,
 		unit='iB',
 		unit_scale=True,
 		unit_divisor=1024,
 	) as bar:
-		for data in resp.iter_content(chunk_size=1024):
+		for data in resp.iter_content(chunk_size=chunk_size):
 			size = file.write(data)
 			bar.update(size)
+	os.replace(tmp_fname, fname)
+	with open(meta_path, 'w') as f:
+		json.dump({'url': url, 'etag': resp.headers.get('ETag'), 'last_modified': resp.headers.get('Last-Modified')}, f)
+	return True
+
+
+def file_checksum(fname: str):
+	h = hashlib.sha256()
+	with open(fname, 'rb') as f:
+		for block in iter(lambda: f.read(1 << 20), b''):
+			h.update(block)
+	return h.hexdigest()
+
+def file_signature(fname: str):
+	stat = os.stat(fname)
+	return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': file_checksum(fname)}
+
+def signature_matches(signature, fname: str):
+	stat = os.stat(fname)
+	if signature.get('size') != stat.st_size:
+		return False
+	if signature.get('mtime_ns') == stat.st_mtime_ns:
+		return True
+	return signature.get('sha256') == file_checksum(fname) # file touched or copied, compare content
+
+
+def iter_chunks(iterable, chunk_size):
+	iterator = iter(iterable)
+	while True:
+		chunk = list(itertools.islice(iterator, chunk_size))
+		if len(chunk) == 0:
+			return
+		yield chunk
+
+def table_format(fname: str):
+	'''
+		:param str fname: Table path, with extension .tsv, .txt, .csv (optionally followed by .gz) or .parquet
+		:return: 'parquet', or the column separator of delimited text files
+		:rtype: str
+	'''
+	suffixes = [suffix.lower() for suffix in Path(fname).suffixes if suffix.lower() != '.gz']
+	if len(suffixes) > 0 and suffixes[-1] == '.parquet':
+		return 'parquet'
+	if len(suffixes) > 0 and suffixes[-1] == '.csv':
+		return ','
+	return '\t'
+
+def read_table_chunks(fname: str, chunk_size: int):
+	'''
+		:param str fname: Table path (see table_format())
+		:param int chunk_size: Number of rows per chunk
+		:return: Generator of DataFrames. Columns of delimited text files are read as strings
+		:rtype: generator
+	'''
+	fmt = table_format(fname)
+	if fmt == 'parquet':
+		try:
+			import pyarrow.parquet as pq
+		except ImportError:
+			raise ImportError('Reading parquet files requires the pyarrow package')
+		for batch in pq.ParquetFile(fname).iter_batches(batch_size=chunk_size):
+			yield batch.to_pandas()
+	else:
+		yield from pd.read_csv(fname, sep=fmt, dtype=str, keep_default_na=False, chunksize=chunk_size)
+
+def write_table_chunks(chunks, fname: str):
+	'''
+		Writes DataFrames to a single table as they are generated.
+
+		:param chunks: Iterable of DataFrames with the same columns
+		:param str fname: Output path (see table_format()). Files ending with .gz are compressed
+		:return: Number of rows written
+		:rtype: int
+	'''
+	fmt = table_format(fname)
+	Path(fname).parent.mkdir(parents=True, exist_ok=True)
+	n_rows = 0
+	if fmt == 'parquet':
+		try:
+			import pyarrow as pa
+			import pyarrow.parquet as pq
+		except ImportError:
+			raise ImportError('Writing parquet files requires the pyarrow package')
+		writer = None
+		for chunk in chunks:
+			table = pa.Table.from_pandas(chunk, preserve_index=False)
+			if writer is None:
+				writer = pq.ParquetWriter(fname, table.schema)
+			writer.write_table(table)
+			n_rows += chunk.shape[0]
+		if writer is not None:
+			writer.close()
+	else:
+		opener = gzip.open if str(fname).lower().endswith('.gz') else open
+		with opener(fname, 'wt', newline='') as f:
+			for i, chunk in enumerate(chunks):
+				chunk.to_csv(f, sep=fmt, index=False, header=i == 0)
+				n_rows += chunk.shape[0]
+	return n_rows
 
 
 def make_list(query):
@@ -27,6 +155,35 @@ def make_list(query):
 		return [query]
 	return query
 
+def factorize_ids(values):
+	'''
+		:param values: IDs (list, numpy array, pandas Series or Index). Categorical values are not factorized again
+		:return: Integer code of each ID and object array of the distinct IDs as strings
+		:rtype: tuple
+	'''
+	if isinstance(getattr(values, 'dtype', None), pd.CategoricalDtype):
+		categorical = pd.Categorical(values)
+		codes, uniques = categorical.codes.astype(np.int64), np.asarray(categorical.categories, dtype=object)
+		if (codes == -1).any():
+			codes[codes == -1] = len(uniques)
+			uniques = np.append(uniques, np.nan)
+	else:
+		if not isinstance(values, (np.ndarray, pd.Series, pd.Index)):
+			values = np.asarray(values, dtype=object)
+		codes, uniques = pd.factorize(values, use_na_sentinel=False)
+	return codes, as_strings(uniques)
+
+def as_strings(values):
+	'''
+		:param values: Array of IDs
+		:return: Object array of the IDs as strings, converted only if some of them are not strings already
+		:rtype: ndarray
+	'''
+	values = np.asarray(values)
+	if values.dtype == object and pd.api.types.infer_dtype(values, skipna=False) == 'string':
+		return values
+	return values.astype(str).astype(object)
+
 def is_list(query):
 	return isinstance(query, collections.abc.Iterable) and not isinstance(query, str)
 
@@ -53,16 +210,164 @@ def consensus_elem(list_of_lists):
 	orders = {elem: -min([lst.index(elem) for lst in list_of_lists if elem in lst]) for elem in set_list}
 	return max(set(flat_list), key=lambda x: (counts[x],priorities[x],orders[x]))
 
-def download_ensembl(path):
-	print(f'Downloading to {path}...')
-	download(queries.ENSEMBL, path)
-	data = pd.read_table(path, header=None, names=['ensg', 'ensp', 'symb', 'synonym', 'entr', 'hgnc'], dtype={'entr': 'str'})[['ensg','ensp','entr','hgnc','symb', 'synonym']]
+def run_batches(func, items, batch_size, max_workers=1, retries=0, backoff=1.0):
+	'''
+		Applies a function to consecutive batches of items, running at most max_workers batches concurrently.
+		Failed batches are retried with exponential backoff.
+
+		:param function func: Function applied to each batch
+		:param list items: Items to split in batches
+		:param int batch_size: Number of items per batch
+		:param int max_workers: Maximum number of batches running at the same time
+		:param int retries: Number of retries of a failed batch before the error is raised
+		:param float backoff: Waiting time before the first retry, in seconds. It doubles at every retry
+		:return: List with the result of each batch (in order) and dictionary with throughput statistics
+		:rtype: tuple
+	'''
+	batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+
+	def run(batch):
+		for attempt in range(retries + 1):
+			try:
+				return func(batch), attempt
+			except Exception:
+				if attempt == retries:
+					raise
+				time.sleep(backoff * 2 ** attempt)
+
+	start = time.perf_counter()
+	if max_workers > 1 and len(batches) > 1:
+		with ThreadPoolExecutor(max_workers=max_workers) as executor:
+			results = list(executor.map(run, batches))
+	else:
+		results = [run(batch) for batch in batches]
+	seconds = time.perf_counter() - start
+	stats = {'items': len(items), 'batches': len(batches), 'retries': sum(attempts for _, attempts in results),
+			 'seconds': seconds, 'items_per_second': len(items) / seconds if seconds > 0 else float('inf')}
+	return [result for result, _ in results], stats
+
+def explode_hits(values, fill_value, split=True):
+	'''
+		:param DataFrame values: Source outputs, one column per source in priority order
+		:param str fill_value: Value of IDs not found by a source (skipped, as well as None)
+		:param bool split: Whether to split multiple hits separated by a pipe ('|') symbol
+		:return: DataFrame with one row per hit and columns 'row' (row position), 'src' (source position), 'pos' (position of the hit in the source output) and 'hit'
+		:rtype: DataFrame
+	'''
+	parts = []
+	for src in range(values.shape[1]):
+		col = values.iloc[:, src]
+		rows = np.flatnonzero(((col != fill_value) & col.notna()).values)
+		col = col.iloc[rows]
+		if split:
+			hits = col.str.split('|')
+			counts = hits.str.len().values.astype(np.int64)
+			col = hits.explode()
+			rows = np.repeat(rows, counts)
+			pos = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+		else:
+			pos = np.zeros(len(rows), dtype=np.int64)
+		parts.append(pd.DataFrame({'row': rows, 'src': src, 'pos': pos, 'hit': col.values}))
+	return pd.concat(parts, ignore_index=True)
+
+def consensus_hits(values, fill_value):
+	'''
+		Vectorized version of consensus_elem() applied to each row. The most frequent hit is selected, with ties
+		broken by the priority of the first source returning it and then by its position in the source outputs.
+
+		:param DataFrame values: Source outputs, one column per source in priority order
+		:param str fill_value: Value of IDs not found by a source
+		:return: Consensus ID of each row (fill_value if no source found the ID)
+		:rtype: ndarray
+	'''
+	output = np.full(values.shape[0], fill_value, dtype=object)
+	hits = explode_hits(values, fill_value)
+	if hits.shape[0] == 0:
+		return output
+	hits['srcpos'] = hits['src'] * (hits['pos'].max() + 1) + hits['pos']
+	stats = hits.groupby(['row', 'hit'], sort=False).agg(count=('src', 'size'), src=('src', 'min'),
+														 pos=('pos', 'min'), srcpos=('srcpos', 'min')).reset_index()
+	stats = stats.sort_values(['row', 'count', 'src', 'pos', 'srcpos'], ascending=[True, False, True, True, True], kind='stable')
+	best = stats.drop_duplicates('row')
+	output[best['row'].values] = best['hit'].values
+	return output
+
+def hits_mismatch(values, fill_value, multi_hits=True):
+	'''
+		:param DataFrame values: Source outputs, one column per source in priority order
+		:param str fill_value: Value of IDs not found by a source
+		:param bool multi_hits: If True, outputs are pipe-separated hit lists and sources mismatch when their lists have no ID in common (see no_intersection()). Otherwise sources mismatch when they return different IDs
+		:return: Whether the sources disagree on each row
+		:rtype: ndarray
+	'''
+	mismatch = np.zeros(values.shape[0], dtype=bool)
+	hits = explode_hits(values, fill_value, split=multi_hits)
+	if hits.shape[0] == 0:
+		return mismatch
+	if multi_hits:
+		hits = hits.drop_duplicates(['row', 'hit', 'src'])
+		n_src = hits.groupby('row')['src'].nunique()
+		coverage = hits.groupby(['row', 'hit'])['src'].size().reset_index(name='n')
+		shared = (coverage['n'].values == n_src.loc[coverage['row']].values)
+		rows_shared = np.unique(coverage['row'].values[shared])
+		mismatch[n_src.index.values] = True
+		mismatch[rows_shared] = False
+	else:
+		n_hits = hits.groupby('row')['hit'].nunique()
+		mismatch[n_hits.index.values] = n_hits.values > 1
+	return mismatch
+
+def change_report(old, new, key='ensg', label='symb'):
+	'''
+		:param DataFrame old: Previous source table (None if there was no previous data)
+		:param DataFrame new: Updated source table
+		:param str key: Column with the stable gene IDs
+		:param str label: Column with the gene names
+		:return: DataFrame with the genes added, retired and renamed, with columns key, 'change', '{label}_old' and '{label}_new'
+		:rtype: DataFrame
+	'''
+	if old is None:
+		old = pd.DataFrame(columns=[key, label])
+	old = old[old[key].notna()].drop_duplicates(key)[[key, label]]
+	new = new[new[key].notna()].drop_duplicates(key)[[key, label]]
+	merged = old.merge(new, on=key, how='outer', suffixes=('_old', '_new'), indicator=True)
+	renamed = (merged['_merge'] == 'both') & (merged[f'{label}_old'].fillna('') != merged[f'{label}_new'].fillna(''))
+	merged['change'] = np.select([merged['_merge'] == 'right_only', merged['_merge'] == 'left_only', renamed],
+								 ['added', 'retired', 'renamed'], default='')
+	merged = merged[merged['change'] != '']
+	return merged[[key, 'change', f'{label}_old', f'{label}_new']].sort_values(['change', key]).reset_index(drop=True)
+
+def download_ensembl(path, url=None, conditional=False, species='human'):
+	if url is None:
+		url = queries.ensembl_query(species)
+	instrumentation.event('download', f'Downloading to {path}...', path=path, url=url)
+	if not download(url, path, conditional=conditional):
+		instrumentation.event('download_not_modified', 'Data did not change since the previous download', path=path, url=url)
+		return False
+	names = [queries.ENSEMBL_COLUMNS[name] for name in queries.ensembl_attributes(species)]
+	data = pd.read_table(path, header=None, names=names, dtype={'entr': 'str'})[[col for col in ['ensg','ensp','entr','hgnc','symb', 'synonym'] if col in names]]
 	data = data[~data.duplicated()]
 	data.to_csv(path,sep='\t',index=False)
+	return True
 
-def download_hgnc(path):
-	print(f'Downloading to {path}...')
-	download(queries.HGNC, path)
+def download_hgnc(path, url=queries.HGNC, conditional=False):
+	instrumentation.event('download', f'Downloading to {path}...', path=path, url=url)
+	if not download(url, path, conditional=conditional):
+		instrumentation.event('download_not_modified', 'Data did not change since the previous download', path=path, url=url)
+		return False
 	data = pd.read_table(path, header=0, names=['hgnc', 'symb', 'entr', 'ensg', 'synonym1', 'synonym2'], dtype={'entr': 'str'})[['ensg','entr','hgnc','symb','synonym1', 'synonym2']]
 	data = data[~data.duplicated()]
-	data.to_csv(path,sep='\t',index=False)
\ No newline at end of file
+	data.to_csv(path,sep='\t',index=False)
+	return True
+
+def download_orthologs(path, species_in, species_out, url=None, conditional=False):
+	if url is None:
+		url = queries.ensembl_orthologs_query(species_in, species_out)
+	instrumentation.event('download', f'Downloading to {path}...', path=path, url=url)
+	if not download(url, path, conditional=conditional):
+		instrumentation.event('download_not_modified', 'Data did not change since the previous download', path=path, url=url)
+		return False
+	data = pd.read_table(path, header=None, names=[f'ensg_{species_in}', f'ensg_{species_out}'], dtype=str).dropna()
+	data = data[~data.duplicated()]
+	data.to_csv(path,sep='\t',index=False)
+	return True
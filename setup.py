@@ -14,6 +14,7 @@ setup(
 	author_email='enrico.maiorino@gmail.com',
 	description='A package to convert gene identifiers between different naming conventions',
 	install_requires=['biothings_client','tqdm','pandas'],
+	entry_points={'console_scripts': ['biorosetta=biorosetta.cli:main']},
 	long_description = long_description,
 	long_description_content_type = 'text/markdown',
 	#package_data={'': ['README_pypi.md']},
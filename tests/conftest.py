@@ -0,0 +1,80 @@
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+
+
+class FakeMyGeneClient:
+	'''
+		Replaces the MyGene client, answering queries from a dictionary. Every call is recorded, and the first
+		`failures` calls raise an error.
+	'''
+	def __init__(self, table, failures=0):
+		self.table = table
+		self.failures = failures
+		self.calls = []
+
+	def getgenes(self, ids, scopes, fields, species, as_dataframe, returnall):
+		self.calls.append(list(ids))
+		if self.failures > 0:
+			self.failures -= 1
+			raise ConnectionError('service unavailable')
+		return pd.DataFrame({fields: [self.table.get(id_) for id_ in ids]}, index=pd.Index(ids, name='query'))
+
+
+@pytest.fixture
+def fake_client():
+	return FakeMyGeneClient({'1': 'ENSG1', '7157': 'ENSG2', '1956': 'ENSG3'})
+
+
+class FixtureServer:
+	'''
+		Local HTTP stand-in serving fixture dumps from memory, with ETag validation. The status of every response is recorded.
+	'''
+	def __init__(self):
+		self.files = {}
+		self.statuses = []
+		server = self
+
+		class Handler(BaseHTTPRequestHandler):
+			def do_GET(self):
+				body = server.files.get(self.path)
+				if body is None:
+					server.statuses.append(404)
+					self.send_error(404)
+					return
+				etag = '"%s"' % hashlib.sha256(body).hexdigest()[:16]
+				if self.headers.get('If-None-Match') == etag:
+					server.statuses.append(304)
+					self.send_response(304)
+					self.end_headers()
+					return
+				server.statuses.append(200)
+				self.send_response(200)
+				self.send_header('ETag', etag)
+				self.send_header('Content-Length', str(len(body)))
+				self.end_headers()
+				self.wfile.write(body)
+
+			def log_message(self, *args):
+				pass
+
+		self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+		self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+		self._thread.start()
+
+	def url(self, path):
+		return f'http://127.0.0.1:{self._httpd.server_port}{path}'
+
+	def close(self):
+		self._httpd.shutdown()
+		self._httpd.server_close()
+
+
+@pytest.fixture
+def http_server():
+	server = FixtureServer()
+	yield server
+	server.close()
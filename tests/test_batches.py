@@ -0,0 +1,56 @@
+import pytest
+
+import biorosetta.utils
+from biorosetta.classes import MyGeneMapper
+from biorosetta.utils import run_batches
+from conftest import FakeMyGeneClient
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+	sleeps = []
+	monkeypatch.setattr(biorosetta.utils.time, 'sleep', sleeps.append)
+	return sleeps
+
+
+def test_run_batches_order():
+	results, stats = run_batches(lambda batch: [x * 2 for x in batch], list(range(10)), 3, max_workers=4)
+	assert results == [[0, 2, 4], [6, 8, 10], [12, 14, 16], [18]]
+	assert stats['items'] == 10 and stats['batches'] == 4 and stats['retries'] == 0
+
+
+def test_run_batches_retries(sleeps):
+	failures = {'n': 2}
+
+	def func(batch):
+		if failures['n'] > 0:
+			failures['n'] -= 1
+			raise ConnectionError('service unavailable')
+		return batch
+
+	results, stats = run_batches(func, [1, 2], 1, retries=3, backoff=0.5)
+	assert results == [[1], [2]]
+	assert stats['retries'] == 2
+	assert sleeps == [0.5, 1.0] # backoff doubles at every retry
+
+
+def test_run_batches_gives_up(sleeps):
+	def func(batch):
+		raise ConnectionError('service unavailable')
+
+	with pytest.raises(ConnectionError):
+		run_batches(func, [1, 2, 3], 2, retries=2, backoff=1.0)
+	assert sleeps == [1.0, 2.0]
+
+
+@pytest.mark.parametrize('max_workers', [1, 4])
+def test_query_retry_and_order(sleeps, max_workers):
+	table = {str(i): f'ENSG{i}' for i in range(0, 50, 3)}
+	client = FakeMyGeneClient(table, failures=1)
+	src = MyGeneMapper(client=client, batch_size=7, max_workers=max_workers, retries=2, backoff=0.1)
+	ids = [str(i) for i in range(49, -1, -1)]
+	output = src.convert(ids, 'entr', 'ensg')
+	assert list(output) == [table.get(id_, 'N/A') for id_ in ids]
+	assert src.query_stats['batches'] == 8 and src.query_stats['retries'] == 1
+	assert len(client.calls) == 9 and all(len(call) <= 7 for call in client.calls)
+	assert sleeps == [0.1]
@@ -0,0 +1,98 @@
+import multiprocessing
+import pickle
+
+import pytest
+
+import biorosetta.cache
+from biorosetta.cache import ResultCache
+from biorosetta.classes import MyGeneMapper
+
+
+class Clock:
+	def __init__(self, now=1000.0):
+		self.now = now
+
+	def __call__(self):
+		return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+	clock = Clock()
+	monkeypatch.setattr(biorosetta.cache.time, 'time', clock)
+	return clock
+
+
+def test_only_misses_queried(fake_client, tmp_path):
+	src = MyGeneMapper(client=fake_client, cache=str(tmp_path / 'cache.sqlite'))
+	assert list(src.convert(['1', '7157', '0'], 'entr', 'ensg')) == ['ENSG1', 'ENSG2', 'N/A']
+	assert list(src.convert(['1', '1956', '0', '7157'], 'entr', 'ensg')) == ['ENSG1', 'ENSG3', 'N/A', 'ENSG2']
+	assert fake_client.calls == [['1', '7157', '0'], ['1956']] # IDs not found are cached too
+	assert src._cache.stats['hits'] == 2 and src._cache.stats['negative_hits'] == 1
+
+
+def test_cache_persists(fake_client, tmp_path):
+	MyGeneMapper(client=fake_client, cache=str(tmp_path / 'cache.sqlite')).convert(['1'], 'entr', 'ensg')
+	src = MyGeneMapper(client=fake_client, cache=str(tmp_path / 'cache.sqlite'))
+	assert list(src.convert(['1'], 'entr', 'ensg')) == ['ENSG1']
+	assert src.convert(['1'], 'entr', 'symb') is not None # different field, not cached
+	assert fake_client.calls == [['1'], ['1']]
+
+
+def test_ttl(fake_client, tmp_path, clock):
+	cache = ResultCache(str(tmp_path / 'cache.sqlite'), ttl=100, negative_ttl=10)
+	src = MyGeneMapper(client=fake_client, cache=cache)
+	src.convert(['1', '0'], 'entr', 'ensg')
+	clock.now += 50 # only the negative entry expired
+	src.convert(['1', '0'], 'entr', 'ensg')
+	clock.now += 60 # both expired
+	src.convert(['1', '0'], 'entr', 'ensg')
+	assert fake_client.calls == [['1', '0'], ['0'], ['1', '0']]
+	assert cache.stats['expired'] == 3
+
+
+def test_no_expiration(tmp_path, clock):
+	cache = ResultCache(str(tmp_path / 'cache.sqlite'), ttl=None)
+	cache.set({'1': 'ENSG1', '0': None}, 'entrezgene', 'ensembl.gene', 'human')
+	clock.now += 10 ** 9
+	assert cache.get(['1', '0'], 'entrezgene', 'ensembl.gene', 'human') == {'1': 'ENSG1', '0': None}
+
+
+def test_lru_eviction(tmp_path, clock):
+	cache = ResultCache(str(tmp_path / 'cache.sqlite'), max_size=2)
+	cache.set({'a': 'A'}, 'scope', 'field', 'human')
+	clock.now += 1
+	cache.set({'b': 'B'}, 'scope', 'field', 'human')
+	clock.now += 1
+	assert cache.get(['a'], 'scope', 'field', 'human') == {'a': 'A'} # a is now more recent than b
+	clock.now += 1
+	cache.set({'c': 'C'}, 'scope', 'field', 'human')
+	assert len(cache) == 2 and cache.stats['evictions'] == 1
+	assert cache.get(['a', 'b', 'c'], 'scope', 'field', 'human') == {'a': 'A', 'c': 'C'}
+
+
+_inherited = None # cache inherited by the forked workers
+
+
+def _write(key):
+	_inherited.set({key: key.upper()}, 'scope', 'field', 'human')
+	return _inherited.get([key, 'parent'], 'scope', 'field', 'human')
+
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='requires fork')
+def test_connection_per_process(tmp_path, monkeypatch):
+	cache = ResultCache(str(tmp_path / 'cache.sqlite'))
+	cache.set({'parent': 'PARENT'}, 'scope', 'field', 'human')
+	monkeypatch.setitem(globals(), '_inherited', cache)
+	with multiprocessing.get_context('fork').Pool(2) as pool:
+		results = pool.map(_write, ['x', 'y', 'z'])
+	assert results == [{'x': 'X', 'parent': 'PARENT'}, {'y': 'Y', 'parent': 'PARENT'}, {'z': 'Z', 'parent': 'PARENT'}]
+	assert len(cache) == 4
+	assert cache.get(['parent'], 'scope', 'field', 'human') == {'parent': 'PARENT'} # parent connection still usable
+
+
+def test_pickle(tmp_path):
+	cache = ResultCache(str(tmp_path / 'cache.sqlite'))
+	cache.set({'a': 'A'}, 'scope', 'field', 'human')
+	copy = pickle.loads(pickle.dumps(cache))
+	assert copy.get(['a'], 'scope', 'field', 'human') == {'a': 'A'}
@@ -0,0 +1,22 @@
+from pathlib import Path
+
+import pytest
+
+from biorosetta.cli import output_paths
+
+
+def test_output_paths(tmp_path):
+	assert output_paths(['a.tsv'], str(tmp_path / 'out.tsv')) == [tmp_path / 'out.tsv']
+	assert output_paths(['d1/a.tsv', 'd2/b.tsv'], str(tmp_path)) == [tmp_path / 'a.tsv', tmp_path / 'b.tsv']
+
+
+def test_output_paths_same_name(tmp_path):
+	with pytest.raises(ValueError, match='both be written'):
+		output_paths(['d1/g.tsv', 'd2/g.tsv'], str(tmp_path))
+
+
+def test_output_paths_same_as_input(tmp_path):
+	path = tmp_path / 'g.tsv'
+	path.write_text('gene\n')
+	with pytest.raises(ValueError, match='same as the input'):
+		output_paths([str(path), 'other.tsv'], str(tmp_path))
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from biorosetta.utils import consensus_elem, no_intersection, consensus_hits, hits_mismatch
+
+
+def reference_consensus(row, fill_value):
+	'''
+		consensus_elem() applied as IDMapper.convert applied it before it was vectorized, returning every hit that
+		shares the best (count, priority, order) key: consensus_elem() leaves full ties to set iteration order.
+	'''
+	lists = [value.split('|') for value in row if value != fill_value]
+	if len(lists) == 0:
+		return [fill_value]
+	flat = sum(lists, [])
+
+	def key(elem):
+		return (flat.count(elem), -min(i for i in range(len(lists)) if elem in lists[i]), -min(lst.index(elem) for lst in lists if elem in lst))
+
+	best = max(key(elem) for elem in set(flat))
+	assert key(consensus_elem(lists)) == best
+	return [elem for elem in dict.fromkeys(flat) if key(elem) == best]
+
+
+def reference_mismatch(row, fill_value, multi_hits):
+	values = pd.Series(row, dtype=object)
+	if multi_hits:
+		return no_intersection(values[values != fill_value].values)
+	return values[values != fill_value].nunique() > 1
+
+
+def random_outputs(rng, n_rows, n_sources, fill_value, multi_hits=True):
+	'''
+		Random source outputs drawn from a small pool of IDs, so that rows often share hits across sources and
+		contain the same hit twice in one source.
+	'''
+	pool = np.array([f'ID{i}' for i in range(6)], dtype=object)
+	columns = {}
+	for src in range(n_sources):
+		values = []
+		for _ in range(n_rows):
+			if rng.random() < 0.3:
+				values.append(fill_value)
+			else:
+				n_hits = rng.integers(1, 5) if multi_hits else 1
+				values.append('|'.join(rng.choice(pool, n_hits)))
+		columns[f'src{src}'] = values
+	data = pd.DataFrame(columns)
+	data.iloc[:max(1, n_rows // 50)] = fill_value # rows without any hit
+	return data
+
+
+@pytest.mark.parametrize('fill_value', ['N/A', 'passthrough', '-'])
+@pytest.mark.parametrize('n_sources', [1, 2, 3])
+def test_consensus_matches_reference(fill_value, n_sources):
+	rng = np.random.default_rng(n_sources)
+	data = random_outputs(rng, 2000, n_sources, fill_value)
+	output = consensus_hits(data, fill_value)
+	for row, value in zip(data.values.tolist(), output):
+		assert value in reference_consensus(row, fill_value)
+
+
+def test_consensus_cases():
+	data = pd.DataFrame({'a': ['X|Y', 'N/A', 'Y|X', 'X|X|Y', 'N/A', 'Y'],
+						 'b': ['Y', 'N/A', 'X', 'Y|Y', 'Z', 'X']})
+	output = consensus_hits(data, 'N/A')
+	assert output.tolist() == ['Y', 'N/A', 'X', 'Y', 'Z', 'Y']
+	for row, value in zip(data.values.tolist(), output):
+		assert reference_consensus(row, 'N/A') == [value]
+
+
+def test_consensus_full_tie():
+	# X and Y have the same count, first source and best position: consensus_elem() picks either one
+	data = pd.DataFrame({'a': ['Y|X'], 'b': ['X|Y']})
+	assert sorted(reference_consensus(data.values[0].tolist(), 'N/A')) == ['X', 'Y']
+	assert consensus_hits(data, 'N/A').tolist() == ['Y']
+
+
+@pytest.mark.parametrize('multi_hits', [True, False])
+@pytest.mark.parametrize('fill_value', ['N/A', '-'])
+def test_mismatch_matches_reference(multi_hits, fill_value):
+	rng = np.random.default_rng(7)
+	data = random_outputs(rng, 2000, 3, fill_value, multi_hits=multi_hits)
+	mismatch = hits_mismatch(data, fill_value, multi_hits=multi_hits)
+	expected = [reference_mismatch(row, fill_value, multi_hits) for row in data.values.tolist()]
+	assert mismatch.tolist() == expected
+
+
+def test_mismatch_cases():
+	data = pd.DataFrame({'a': ['X|Y', 'N/A', 'X|X', 'X', 'N/A'],
+						 'b': ['Y', 'N/A', 'Y|Y', 'N/A', 'Z']})
+	assert hits_mismatch(data, 'N/A').tolist() == [False, False, True, False, False]
+	assert hits_mismatch(data, 'N/A', multi_hits=False).tolist() == [True, False, True, False, False]
+
+
+def test_all_missing():
+	data = pd.DataFrame({'a': ['N/A'] * 3, 'b': ['N/A'] * 3})
+	assert consensus_hits(data, 'N/A').tolist() == ['N/A'] * 3
+	assert hits_mismatch(data, 'N/A').tolist() == [False] * 3
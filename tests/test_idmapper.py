@@ -0,0 +1,36 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+from biorosetta.classes import LocalSource, MyGeneMapper, IDMapper
+from biorosetta.instrument import Instrumentation
+
+
+@pytest.fixture
+def sources(fake_client, tmp_path):
+	data = pd.DataFrame({'ensg': ['ENSG1', 'ENSG2', 'ENSG4'], 'entr': ['1', '7157', '1956'], 'symb': ['A1BG', 'TP53', 'EGFR']})
+	return [LocalSource('local', data), MyGeneMapper(client=fake_client, cache=str(tmp_path / 'cache.sqlite'))]
+
+
+@pytest.mark.parametrize('executor', [None, False, ThreadPoolExecutor(2), ProcessPoolExecutor(2)])
+def test_executors(sources, executor):
+	idm = IDMapper(sources, executor=executor, instrumentation=Instrumentation(enabled=True))
+	report = idm.convert(['7157', '1956', '0'], 'entr', 'ensg', multi_hits='consensus', df=True)
+	assert report['output'].tolist() == ['ENSG2', 'ENSG4', 'N/A']
+	assert report['local'].tolist() == ['ENSG2', 'ENSG4', 'N/A']
+	assert report['mygene'].tolist() == ['ENSG2', 'ENSG3', 'N/A']
+	assert report['mismatch'].tolist() == [False, True, False]
+	assert set(report.attrs['sources']) == {'local', 'mygene'}
+
+
+def test_multi_hop_no_warnings(capsys):
+	events = []
+	symb_ensg = LocalSource('symb_ensg', pd.DataFrame({'symb': ['A1BG', 'TP53'], 'ensg': ['ENSG1', 'ENSG2']}))
+	ensg_entr = LocalSource('ensg_entr', pd.DataFrame({'ensg': ['ENSG1', 'ENSG2'], 'entr': ['1', '7157']}))
+	idm = IDMapper([symb_ensg, ensg_entr], instrumentation=Instrumentation(callbacks=[lambda kind, name, fields: events.append(name)]))
+	assert idm.convert(['TP53', 'A1BG', 'NOPE'], 'symb', 'entr') == ['7157', '1', 'N/A']
+	assert 'unsupported_sources' not in events
+	assert capsys.readouterr().out == ''
+	idm.convert(['TP53'], 'symb', 'ensg') # direct mappings still warn
+	assert events.count('unsupported_sources') == 1
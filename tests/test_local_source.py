@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from biorosetta.classes import LocalSource, MyGeneMapper, IDMapper
+
+
+@pytest.fixture
+def source():
+	data = pd.DataFrame({'ensg': ['ENSG1', 'ENSG2', 'ENSG3'], 'symb': ['A1BG', 'TP53', 'EGFR'], 'entr': ['1', '7157', '1956']})
+	return LocalSource('test', data)
+
+
+@pytest.mark.parametrize('make', [list, tuple, np.array, pd.Series, pd.Index, lambda ids: (x for x in ids), lambda ids: iter(ids)])
+def test_convert_iterables(source, make):
+	assert source.convert(make(['TP53', 'A1BG', 'NOPE']), 'symb', 'ensg') == ['ENSG2', 'ENSG1', 'N/A']
+
+
+def test_convert_set_and_scalar(source):
+	assert source.convert({'A1BG'}, 'symb', 'ensg') == ['ENSG1']
+	assert source.convert('A1BG', 'symb', 'ensg') == 'ENSG1'
+	assert source.convert([7157, 1.0], 'entr', 'symb') == ['TP53', 'N/A']
+
+
+def test_idmapper_iterables(source):
+	idm = IDMapper([source])
+	assert idm.convert((x for x in ['EGFR', 'TP53']), 'symb', 'entr') == ['1956', '7157']
+	assert idm.convert({'EGFR'}, 'symb', 'entr') == ['1956']
+
+
+def test_mygene_iterables(fake_client):
+	src = MyGeneMapper(client=fake_client)
+	assert list(src.convert((x for x in ['7157', '0']), 'entr', 'ensg')) == ['ENSG2', 'N/A']
+	assert list(src.convert({'1'}, 'entr', 'ensg')) == ['ENSG1']
+
+
+@pytest.mark.parametrize('pairs', ['all', None])
+def test_idmapper_warm_all(source, pairs):
+	IDMapper([source]).warm(pairs)
+	assert all(source._index.has_table(*pair) for pair in source._index.pairs())
+
+
+def test_idmapper_warm_pairs(source):
+	IDMapper([source]).warm([('symb', 'ensg'), ('symb', 'refseq')])
+	assert source._index.has_table('symb', 'ensg') and not source._index.has_table('ensg', 'symb')
@@ -0,0 +1,76 @@
+import pytest
+
+from biorosetta.classes import HGNCBiomartMapper, EnsemblOrthologMapper
+from biorosetta.instrument import instrumentation
+
+HGNC_HEADER = 'HGNC ID\tApproved symbol\tNCBI Gene ID\tEnsembl gene ID\tAlias symbol\tPrevious symbol\n'
+HGNC_V1 = HGNC_HEADER + ('HGNC:5\tA1BG\t1\tENSG00000121410\t\t\n'
+						 'HGNC:11998\tTP53\t7157\tENSG00000141510\tLFS1\t\n'
+						 'HGNC:3236\tEGFR\t1956\tENSG00000146648\tERBB1\t\n')
+# EGFR retired, TP53 renamed and BRCA1 added
+HGNC_V2 = HGNC_HEADER + ('HGNC:5\tA1BG\t1\tENSG00000121410\t\t\n'
+						 'HGNC:11998\tTP53X\t7157\tENSG00000141510\tLFS1\tTP53\n'
+						 'HGNC:1100\tBRCA1\t672\tENSG00000012048\tRNF53\t\n')
+
+
+@pytest.fixture
+def events(monkeypatch):
+	names = []
+	monkeypatch.setattr(instrumentation, 'verbose', False)
+	monkeypatch.setattr(instrumentation, 'callbacks', [lambda kind, name, fields: names.append(name)])
+	return names
+
+
+def counts(changes):
+	return changes['change'].value_counts().to_dict()
+
+
+def test_refresh(http_server, tmp_path, events):
+	url = http_server.url('/hgnc.txt')
+	data_path = str(tmp_path / 'hgnc.tsv')
+	http_server.files['/hgnc.txt'] = HGNC_V1.encode()
+
+	src, changes = HGNCBiomartMapper.refresh(data_path=data_path, url=url)
+	assert http_server.statuses == [200]
+	assert counts(changes) == {'added': 3}
+	assert src.convert(['TP53', 'ERBB1'], 'symb', 'entr') == ['7157', '1956']
+
+	del events[:]
+	src, changes = HGNCBiomartMapper.refresh(data_path=data_path, url=url)
+	assert http_server.statuses == [200, 304]
+	assert len(changes) == 0
+	assert 'cache_load' in events and 'cache_rebuild' not in events
+
+	http_server.files['/hgnc.txt'] = HGNC_V2.encode()
+	src, changes = HGNCBiomartMapper.refresh(data_path=data_path, url=url)
+	assert http_server.statuses == [200, 304, 200]
+	assert counts(changes) == {'added': 1, 'retired': 1, 'renamed': 1}
+	renamed = changes[changes['change'] == 'renamed'].iloc[0]
+	assert (renamed['ensg'], renamed['symb_old'], renamed['symb_new']) == ('ENSG00000141510', 'TP53', 'TP53X')
+	assert src.convert(['TP53', 'BRCA1', 'EGFR'], 'symb', 'entr') == ['7157', '672', 'N/A']
+
+
+def test_refresh_force(http_server, tmp_path, events):
+	url = http_server.url('/hgnc.txt')
+	data_path = str(tmp_path / 'hgnc.tsv')
+	http_server.files['/hgnc.txt'] = HGNC_V1.encode()
+	HGNCBiomartMapper.refresh(data_path=data_path, url=url)
+	src, changes = HGNCBiomartMapper.refresh(data_path=data_path, url=url, force=True)
+	assert http_server.statuses == [200, 200]
+	assert len(changes) == 0
+
+
+def test_refresh_orthologs(http_server, tmp_path, events):
+	url = http_server.url('/orthologs.txt')
+	data_path = str(tmp_path / 'orthologs.tsv')
+	http_server.files['/orthologs.txt'] = b'ENSG1\tENSMUSG1\nENSG2\tENSMUSG2\nENSG3\tENSMUSG3\n'
+	src, changes = EnsemblOrthologMapper.refresh('human', 'mouse', data_path=data_path, url=url)
+	assert counts(changes) == {'added': 3}
+
+	src, changes = EnsemblOrthologMapper.refresh('human', 'mouse', data_path=data_path, url=url)
+	assert http_server.statuses == [200, 304] and len(changes) == 0
+
+	http_server.files['/orthologs.txt'] = b'ENSG1\tENSMUSG1\nENSG2\tENSMUSG9\nENSG4\tENSMUSG4\n'
+	src, changes = EnsemblOrthologMapper.refresh('human', 'mouse', data_path=data_path, url=url)
+	assert counts(changes) == {'added': 1, 'retired': 1, 'renamed': 1}
+	assert src.convert(['ENSG2', 'ENSG3'], 'ensg_human', 'ensg_mouse') == ['ENSMUSG9', 'N/A']